@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+from timeseries import GRAINS, LABELS
+
+
+def group_codes(keys):
+    # Dense group code per row for any number of key columns, plus the distinct key combinations.
+    codes, levels = [], []
+    for name in keys.columns:
+        c, u = pd.factorize(keys[name], sort=True)
+        codes.append(c)
+        levels.append(u)
+    combined = np.ravel_multi_index(codes, [len(u) for u in levels]) if len(codes) > 1 else codes[0]
+    group, distinct = pd.factorize(combined, sort=True)
+    parts = np.unravel_index(distinct, [len(u) for u in levels]) if len(codes) > 1 else [distinct]
+    uniques = pd.DataFrame({name: u.take(p) for name, u, p in zip(keys.columns, levels, parts)})
+    return group, uniques
+
+
+def error_metrics(keys, forecast, actual):
+    """MAPE, bias and RMSE of forecast vs actual for every distinct combination of ``keys``.
+
+    All groups are computed together with weighted bincounts; there is no per-group Python loop.
+    Rows whose actual or forecast is missing (NaN or infinite) are left out and not counted in ``n``;
+    MAPE also skips rows whose actual is zero. A group without valid rows has NaN metrics.
+    """
+    group, summary = group_codes(keys)
+    forecast = np.asarray(forecast, dtype=np.float64)
+    actual = np.asarray(actual, dtype=np.float64)
+    size = len(summary)
+    valid = np.isfinite(forecast) & np.isfinite(actual)
+    group, forecast, actual = group[valid], forecast[valid], actual[valid]
+    error = forecast - actual
+    nonzero = actual != 0
+
+    n = np.bincount(group, minlength=size)
+    n_pct = np.bincount(group[nonzero], minlength=size)
+    abs_pct = np.bincount(group[nonzero], weights=np.abs(error[nonzero] / actual[nonzero]), minlength=size)
+    sum_error = np.bincount(group, weights=error, minlength=size)
+    sum_sq = np.bincount(group, weights=error ** 2, minlength=size)
+
+    def per_row(total, count):
+        return np.divide(total, count, out=np.full(size, np.nan), where=count > 0)
+
+    summary['n'] = n.astype(np.int32)
+    summary['mape'] = per_row(abs_pct, n_pct).astype(np.float32)
+    summary['bias'] = per_row(sum_error, n).astype(np.float32)
+    summary['rmse'] = np.sqrt(per_row(sum_sq, n)).astype(np.float32)
+    return summary
+
+
+def fleet_accuracy(store, farm_ids, farm_clusters, grain='Annual', by=('cluster', 'period'), since=None):
+    # Metrics over the rows of a YieldSeriesStore whose series are farms; `by` picks the grouping and
+    # `since` (a month index) drops earlier rows, e.g. a forecaster's warm-up season.
+    table = store.table()
+    if since is not None:
+        table = table[table['month'] >= since]
+    bucket = GRAINS[grain](table['month'].to_numpy(np.int64))
+    distinct, inverse = np.unique(bucket, return_inverse=True)
+    keys = pd.DataFrame({
+        'farm': np.asarray(farm_ids)[table['series']],
+        'cluster': np.asarray(farm_clusters)[table['series']],
+        'period': pd.Categorical.from_codes(inverse, categories=[LABELS[grain](b) for b in distinct], ordered=True),
+    })
+    return error_metrics(keys[list(by)], table['forecast'], table['actual'])
@@ -1,7 +1,23 @@
 import streamlit as st
-import plotly.graph_objects as go
-import pandas as pd
-import numpy as np
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from profiling import begin_rerun, end_rerun, export_json, export_prometheus, timed
+
+# --- PROFILING ---
+# ?profile=cprofile (or pyinstrument) attaches a profiler to this rerun; AGRI_PROFILE does it for all.
+SESSION_ID = get_script_run_ctx().session_id if get_script_run_ctx() else "local"
+RERUN = begin_rerun(SESSION_ID, profile=st.query_params.get("profile"))
+
+with timed('startup.imports'):
+    from accuracy import fleet_accuracy
+    from artifacts import (ModelArtifact, available_regions, current_artifact_path, is_published, region_model_dir,
+                           training_history)
+    from charts import ChartSpec, chart_spec, radar_axes, radar_figure, scenario_figure, tracking_figure
+    from core import Recommender
+    from forecast import cluster_forecaster, farm_forecaster
+    from neighbors import load_farm_index, match_score
+    from scenario import SWEEP_FEATURES, Sweep, default_ranges
+    from session import ProfileRecord, SessionRegistry, SharedCache
 
 # --- CONFIGURATION ---
 st.set_page_config(
@@ -10,63 +26,115 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# --- MOCK DATA ---
-MOCK_CLUSTERS = {
-    0: {"name": "Tropical / High Nitrogen Zone", "crop": "Rice", "avg_n": 90, "avg_p": 40, "avg_k": 40, "match": "92%"},
-    1: {"name": "Arid / Sandy Soil Zone", "crop": "Chickpea", "avg_n": 20, "avg_p": 60, "avg_k": 20, "match": "88%"},
-    2: {"name": "Temperate / Loam Zone", "crop": "Maize", "avg_n": 70, "avg_p": 50, "avg_k": 50, "match": "95%"},
-}
-
-MOCK_RULES = {
-    "Rice": [
-        {"item": "Urea Fertilizer (High N)", "type": "soil", "conf": "92%", "lift": 3.4,
-         "desc": "Essential for leafy growth in wet conditions."},
-        {"item": "Flooding Irrigation (Weekly)", "type": "water", "conf": "88%", "lift": 2.1,
-         "desc": "Maintains anaerobic soil conditions."}
-    ],
-    "Maize": [
-        {"item": "DAP Fertilizer (NP Mix)", "type": "soil", "conf": "85%", "lift": 2.8,
-         "desc": "Crucial for root development and stalk strength."},
-        {"item": "Sprinkler Irrigation", "type": "water", "conf": "79%", "lift": 1.9,
-         "desc": "Ensures even coverage during tasseling."}
-    ],
-    "Chickpea": [
-        {"item": "Bio-Compost Application", "type": "soil", "conf": "95%", "lift": 4.1,
-         "desc": "Improves soil structure in sandy textures."},
-        {"item": "Drip Irrigation", "type": "water", "conf": "81%", "lift": 2.5,
-         "desc": "Prevents root rot by delivering water directly."}
-    ]
-}
-
-
-def get_tracking_data(period):
-    if period == 'Monthly':
-        periods = pd.date_range(start='2024-01-01', periods=12, freq='M').strftime('%Y-%m')
-        forecast = np.random.randint(80, 120, 12)
-        actual = np.random.randint(70, 110, 12)
-    elif period == 'Quarterly':
-        periods = pd.date_range(start='2023-01-01', periods=4, freq='Q').strftime('Q%q %Y')
-        forecast = np.random.randint(250, 350, 4)
-        actual = np.random.randint(240, 340, 4)
-    else:  # Annual
-        periods = pd.date_range(start='2020-01-01', periods=5, freq='Y').strftime('%Y')
-        forecast = np.random.randint(1000, 1400, 5)
-        actual = np.random.randint(950, 1350, 5)
-
-    return pd.DataFrame({
-        'Period': periods,
-        'Forecasted Yield (kg)': forecast,
-        'Actual Yield (kg)': actual
-    }).set_index('Period')
+# --- MODELS ---
+@timed('load_model_artifact')
+@st.cache_resource(max_entries=2)
+def load_model_artifact(path):
+    # One in-memory copy per artifact version, shared by every session in the process. Two entries
+    # let sessions that started on the previous version finish while new ones pick up the new one.
+    return ModelArtifact(path)
+
+
+@timed('load_recommender')
+@st.cache_resource(max_entries=2)
+def load_recommender(model_path):
+    # The same UI-free core the batch scorer and HTTP service use.
+    return Recommender(load_model_artifact(model_path))
+
+
+@timed('load_neighbour_index')
+@st.cache_resource(max_entries=2)
+def load_neighbour_index(model_path):
+    # Built next to the artifact on first use, then memory-mapped by every process.
+    return load_farm_index(load_model_artifact(model_path))
+
+
+@timed('similar_farms')
+@st.cache_data(ttl=3600, max_entries=1024, show_spinner=False)
+def similar_farms(profile, model_path, k=50):
+    # `profile` is a tuple of (field, value) pairs so it can be part of the cache key.
+    return load_neighbour_index(model_path).search(dict(profile), k=k)
+
+
+@timed('scenario_sweep')
+@st.cache_resource(max_entries=16)
+def scenario_sweep(profile, model_path, steps):
+    # Every combination of the swept inputs around the profile, assigned in one vectorized pass.
+    profile = dict(profile)
+    return Sweep(load_recommender(model_path), profile, default_ranges(profile, steps=steps))
+
+
+@timed('load_forecaster')
+@st.cache_resource(max_entries=2)
+def load_forecaster(model_path):
+    artifact = load_model_artifact(model_path)
+    return cluster_forecaster(artifact.model, training_history(artifact))
+
+
+@timed('get_tracking_data')
+@st.cache_data(ttl=3600, max_entries=1024, show_spinner=False)
+def get_tracking_data(period, farm, model_path):
+    # LRU + TTL memo keyed by (farm, period, model version): switching tabs or rerunning rebuilds nothing.
+    # The tracked "farm" is the mean farm of the user's cluster.
+    return load_forecaster(model_path).tracking_frame(farm, period)
+
+
+@timed('get_fleet_accuracy')
+@st.cache_data(ttl=3600, max_entries=4, show_spinner=False)
+def get_fleet_accuracy(model_path):
+    # Forecast accuracy of every historical farm: per cluster and year, and the worst farms last year.
+    artifact = load_model_artifact(model_path)
+    forecaster, farm_ids, clusters = farm_forecaster(artifact.model, training_history(artifact))
+    args = (forecaster.store, farm_ids, clusters)
+    by_cluster = fleet_accuracy(*args, since=forecaster.scored_from)
+    by_farm = fleet_accuracy(*args, by=('farm', 'cluster', 'period'), since=forecaster.scored_from)
+    latest = by_farm[by_farm['period'] == by_farm['period'].max()]
+    return by_cluster, latest.nlargest(10, 'mape')
+
+
+@st.cache_resource
+def session_registry():
+    # Per-session derived data and memory accounting, outside st.session_state.
+    return SessionRegistry()
+
+
+@st.cache_resource
+def shared_figures():
+    return SharedCache(maxsize=512)
 
 
 # --- STATE MANAGEMENT ---
+# Session state holds only small handles (a ProfileRecord, IDs, the model path); data frames and
+# figures come from shared caches, and derived per-session data lives in the session registry.
+ALL_REGIONS = "All regions"
 if 'step' not in st.session_state: st.session_state.step = 1
-if 'user_data' not in st.session_state: st.session_state.user_data = {}
+if 'profile' not in st.session_state: st.session_state.profile = None
 if 'result_cluster' not in st.session_state: st.session_state.result_cluster = None
+# "All regions" needs a global model; train.py on its own publishes only region models.
+REGIONS = available_regions()
+REGION_CHOICES = ([ALL_REGIONS] if is_published() else []) + REGIONS
+if st.session_state.get('region') not in REGION_CHOICES:
+    st.session_state.region = REGION_CHOICES[0] if REGION_CHOICES else ALL_REGIONS
+# A session stays on the artifact it was classified with; new analyses pick up the published version
+# of the selected region's model (or the global one).
+if 'model_path' not in st.session_state or st.session_state.step == 1:
+    region = st.session_state.region
+    try:
+        st.session_state.model_path = current_artifact_path(
+            *([] if region == ALL_REGIONS else [region_model_dir(region)]))
+    except FileNotFoundError as error:
+        end_rerun(RERUN)
+        st.error(str(error))
+        st.stop()
+
+RECOMMENDER = load_recommender(st.session_state.model_path)
+MOCK_CLUSTERS = RECOMMENDER.clusters
+SESSIONS = session_registry()
+DERIVED = SESSIONS.derived(SESSION_ID)
 
 # --- CUSTOM CSS STYLING ---
-st.markdown("""
+with timed('css'):
+    st.markdown("""
     <style>
     @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;600;700&display=swap');
 
@@ -201,20 +269,24 @@ def render_header():
     """, unsafe_allow_html=True)
 
 
+def session_figure(name, key, build):
+    # Process-wide memo of serialized charts: if the inputs behind a chart are unchanged, reuse its
+    # spec without touching the data or the chart layer at all; sessions showing the same chart share it.
+    def timed_build():
+        with timed(f'chart.{name}'):
+            return chart_spec(build())
+    return ChartSpec(shared_figures().get_or_build((name, key), timed_build))
+
+
 def reset_app():
     st.session_state.step = 1
-    st.session_state.user_data = {}
+    st.session_state.profile = None
     st.rerun()
 
 
+@timed('analyze_data_quick')
 def analyze_data_quick():
-    n_val = st.session_state.user_data.get('N', 50)
-    if n_val > 80:
-        st.session_state.result_cluster = 0
-    elif n_val < 40:
-        st.session_state.result_cluster = 1
-    else:
-        st.session_state.result_cluster = 2
+    st.session_state.result_cluster = RECOMMENDER.recommend(st.session_state.profile.as_dict())['cluster']
     st.session_state.step = 2
     st.rerun()
 
@@ -247,6 +319,7 @@ def info_box_weather(text):
 # =================VIEWS=================
 
 # --- VIEW 1: FARMER PROFILE INPUT ---
+@timed('view.profile')
 def render_profile_view():
     render_header()
 
@@ -292,23 +365,26 @@ def render_profile_view():
 
     st.markdown("<br><hr>", unsafe_allow_html=True)
 
-    st.session_state.user_data = {'N': n, 'P': p, 'K': k, 'ph': ph, 'temp': temp, 'irrigation': irrigation}
+    st.session_state.profile = ProfileRecord(N=n, P=p, K=k, ph=ph, temp=temp, humidity=humidity,
+                                             rainfall=rain, irrigation=irrigation)
 
     col_center = st.columns([1, 2, 1])
     with col_center[1]:
-        if st.button("Analyze Soil & Generate Plan", use_container_width=True):
+        if st.button("Analyze Soil & Generate Plan", width="stretch"):
             analyze_data_quick()
 
     st.markdown('</div>', unsafe_allow_html=True)
 
 
 # --- VIEW 2: ZONE REVEAL ---
+@timed('view.zone')
 def render_zone_view():
     render_header()
 
     cluster_id = st.session_state.result_cluster
     cluster_info = MOCK_CLUSTERS[cluster_id]
-    user_vals = st.session_state.user_data
+    user_vals = st.session_state.profile
+    neighbours = similar_farms(user_vals.key(), st.session_state.model_path)
 
     st.markdown('<div class="agri-card">', unsafe_allow_html=True)
     st.markdown(f"<h2 style='color: #2E5A31;'>Phase A Result: Cluster Identification</h2>", unsafe_allow_html=True)
@@ -318,7 +394,8 @@ def render_zone_view():
     m1, m2, m3 = st.columns(3)
     m1.metric("Cluster Zone Type", cluster_info['name'])
     m2.metric("Recommended Crop", cluster_info['crop'], delta="Highest Historical Yield")
-    m3.metric("Cluster Match Score", cluster_info['match'])
+    m3.metric("Cluster Match Score", f"{match_score(neighbours, cluster_id):.0%}",
+              delta=f"of {len(neighbours)} most similar farms", delta_color="off")
     st.markdown('</div>', unsafe_allow_html=True)
 
     st.markdown('<div class="agri-card">', unsafe_allow_html=True)
@@ -326,36 +403,13 @@ def render_zone_view():
 
     with c1:
         st.markdown("<h3 style='color: #333333;'>Cluster Compatibility Scan (Radar View)</h3>", unsafe_allow_html=True)
-        categories = [
-            '<span style="color:#2E5A31"><b>Nitrogen</b></span>',
-            '<span style="color:#2E5A31"><b>Phosphorus</b></span>',
-            '<span style="color:#2E5A31"><b>Potassium</b></span>',
-            '<span style="color:#2E5A31"><b>pH</b></span>',
-            '<span style="color:#000080"><b>Temp</b></span>'
-        ]
-
-        fig = go.Figure()
-        fig.add_trace(go.Scatterpolar(
-            r=[cluster_info['avg_n'], cluster_info['avg_p'], cluster_info['avg_k'], 65, 50],
-            theta=categories, fill='toself', name='Ideal Cluster Average',
-            line_color='#4CAF50', fillcolor='rgba(76, 175, 80, 0.4)'
-        ))
-        fig.add_trace(go.Scatterpolar(
-            r=[user_vals['N'], user_vals['P'], user_vals['K'], user_vals['ph'] * 10, user_vals['temp'] * 2],
-            theta=categories, fill='toself', name='Your Farm Profile',
-            line_color='#1E88E5', fillcolor='rgba(30, 136, 229, 0.2)'
-        ))
-
-        fig.update_layout(
-            polar=dict(radialaxis=dict(visible=True, range=[0, 150], gridcolor='#E0E0E0')),
-            showlegend=True,
-            margin=dict(l=40, r=40, t=20, b=20),
-            height=350,
-            paper_bgcolor='white',
-            plot_bgcolor='white',
-            font=dict(color="#333333")
-        )
-        st.plotly_chart(fig, use_container_width=True)
+        cluster_r = (cluster_info['avg_n'], cluster_info['avg_p'], cluster_info['avg_k'],
+                     cluster_info['avg_ph'] * 10, cluster_info['avg_temp'] * 2)
+        neighbour_r = tuple(tuple(round(float(v), 2) for v in radar_axes(neighbours.quantile(q, numeric_only=True)))
+                            for q in (0.25, 0.5, 0.75))
+        fig = session_figure('radar', (cluster_r, radar_axes(user_vals), neighbour_r),
+                             lambda: radar_figure(cluster_r, radar_axes(user_vals), neighbour_r))
+        st.plotly_chart(fig, width="stretch")
 
     with c2:
         st.markdown("<h3 style='color: #2E5A31;'>Interpretative Insight</h3>", unsafe_allow_html=True)
@@ -366,18 +420,52 @@ def render_zone_view():
         </p>
         """, unsafe_allow_html=True)
 
+        crop_yield = neighbours.loc[neighbours['crop'] == cluster_info['crop'], 'yield']
+        if len(crop_yield):
+            st.markdown(f"""
+            <p style="color: #333333;">
+            <b>Farms like yours:</b> {len(crop_yield)} of the {len(neighbours)} most similar historical farms grew
+            {cluster_info['crop']}, with a median yield of <b>{crop_yield.median():,.0f} kg/ha</b> (orange lines).
+            </p>
+            """, unsafe_allow_html=True)
+        nearest = neighbours.head(5)[['farm_id', 'crop', 'yield']].rename(
+            columns={'farm_id': 'Farm', 'crop': 'Crop', 'yield': 'Yield (kg/ha)'})
+        st.dataframe(nearest.style.format({'Yield (kg/ha)': '{:,.0f}'}), hide_index=True, width="stretch")
+
         st.button("View Proactive Resource Plan", on_click=lambda: st.session_state.update(step=3),
-                  use_container_width=True)
+                  width="stretch")
 
     st.markdown('</div>', unsafe_allow_html=True)
 
+    with st.expander("What-if scenarios"):
+        # A form, so changing the axes or the resolution costs one rerun on submit rather than one per widget.
+        with st.form("scenario"):
+            a1, a2, a3 = st.columns(3)
+            x = a1.selectbox("Horizontal axis", SWEEP_FEATURES, index=SWEEP_FEATURES.index('N'))
+            y = a2.selectbox("Vertical axis", SWEEP_FEATURES, index=SWEEP_FEATURES.index('rainfall'))
+            steps = a3.slider("Steps per input", 4, 10, 7, help="The sweep covers about steps^6 scenarios.")
+            submitted = st.form_submit_button("Run sweep")
+        if submitted:
+            if x == y:
+                st.warning("Pick two different inputs for the map.")
+            else:
+                sweep = scenario_sweep(user_vals.key(), st.session_state.model_path, steps)
+                st.caption(f"{len(sweep):,} scenarios: every combination of N, P, K, pH, temperature and rainfall "
+                           "around your profile (x). Colours show the recommended crop with the other inputs "
+                           "at your values; the table shows how far each input can move before it changes.")
+                fig = session_figure('scenario', (user_vals.key(), st.session_state.model_path, steps, x, y),
+                                     lambda: scenario_figure(sweep, x, y))
+                st.plotly_chart(fig, width="stretch")
+
 
 # --- VIEW 3: RESOURCE PLANNER ---
+@timed('view.planner')
 def render_planner_view():
     render_header()
     cluster_id = st.session_state.result_cluster
     crop = MOCK_CLUSTERS[cluster_id]['crop']
-    rules = MOCK_RULES[crop]
+    rules = RECOMMENDER.baskets[cluster_id]
+    actions = RECOMMENDER.actions[cluster_id]
 
     st.markdown('<div class="agri-card">', unsafe_allow_html=True)
     st.markdown(f"<h2 style='color: #2E5A31;'>Phase B: Proactive Resource Plan for {crop}</h2>", unsafe_allow_html=True)
@@ -415,27 +503,34 @@ def render_planner_view():
         st.markdown("<h3 style='color: #2E5A31;'>Executive Summary</h3>", unsafe_allow_html=True)
         st.markdown("<h4 style='color: #2E5A31;'>Key Actions</h4>", unsafe_allow_html=True)
 
+        action_items = []
+        if 'soil' in actions:
+            action_items.append(f"<li>Secure <b>{actions['soil']}</b>.</li>")
+        if 'water' in actions:
+            action_items.append(f"<li>Prepare for <b>{actions['water']}</b>.</li>")
+        if not action_items:
+            action_items.append("<li>No practice stands out for top-yielding farms in this cluster yet.</li>")
         st.markdown(f"""
         <ul style="color: #333333;">
-            <li>Secure <b>{rules[0]['item']}</b>.</li>
-            <li>Prepare for <b>{rules[1]['item']}</b>.</li>
+            {''.join(action_items)}
         </ul>
         """, unsafe_allow_html=True)
 
         st.markdown("</div>", unsafe_allow_html=True)
         st.markdown("<br>", unsafe_allow_html=True)
 
-        if st.button("View Forecast Tracking", use_container_width=True):
+        if st.button("View Forecast Tracking", width="stretch"):
             st.session_state.step = 4
             st.rerun()
 
-        if st.button("Start New Analysis", use_container_width=True):
+        if st.button("Start New Analysis", width="stretch"):
             reset_app()
 
     st.markdown('</div>', unsafe_allow_html=True)
 
 
 # --- VIEW 4: TRACKING ---
+@timed('view.tracking')
 def render_tracking_view():
     render_header()
 
@@ -445,80 +540,39 @@ def render_tracking_view():
                 unsafe_allow_html=True)
     st.markdown("---")
 
-    tab1, tab2, tab3 = st.tabs(["Monthly", "Quarterly", "Annual"])
-
-    # Common Styling for all Tracking Charts
-    def style_chart(fig):
-        fig.update_layout(
-            paper_bgcolor='white',  # Force White Background (Outside)
-            plot_bgcolor='white',  # Force White Background (Inside)
-            font=dict(color='black'),  # Force All Text to Black
-            xaxis=dict(
-                showgrid=True,
-                gridcolor='#f0f0f0',
-                linecolor='black',
-                tickfont=dict(color='black')
-            ),
-            yaxis=dict(
-                showgrid=True,
-                gridcolor='#f0f0f0',
-                linecolor='black',
-                tickfont=dict(color='black')
-            ),
-            legend=dict(
-                font=dict(color='black'),
-                bgcolor='rgba(255,255,255,0.5)'
-            ),
-            margin=dict(l=40, r=40, t=20, b=20)
-        )
-        return fig
-
-    with tab1:
-        st.markdown("<h4 style='color: #2E5A31;'>Monthly Performance</h4>", unsafe_allow_html=True)
-        df_monthly = get_tracking_data('Monthly')
-
-        fig_m = go.Figure()
-        fig_m.add_trace(go.Scatter(
-            x=df_monthly.index, y=df_monthly['Forecasted Yield (kg)'],
-            mode='lines+markers', name='Forecast', line=dict(color='#4CAF50', width=3)
-        ))
-        fig_m.add_trace(go.Scatter(
-            x=df_monthly.index, y=df_monthly['Actual Yield (kg)'],
-            mode='lines+markers', name='Actual', line=dict(color='#1E88E5', width=3)
-        ))
-        st.plotly_chart(style_chart(fig_m), use_container_width=True)
-
-    with tab2:
-        st.markdown("<h4 style='color: #2E5A31;'>Quarterly Performance</h4>", unsafe_allow_html=True)
-        df_quarterly = get_tracking_data('Quarterly')
-
-        fig_q = go.Figure()
-        fig_q.add_trace(go.Bar(
-            x=df_quarterly.index, y=df_quarterly['Forecasted Yield (kg)'],
-            name='Forecast', marker_color='#4CAF50'
-        ))
-        fig_q.add_trace(go.Bar(
-            x=df_quarterly.index, y=df_quarterly['Actual Yield (kg)'],
-            name='Actual', marker_color='#1E88E5'
-        ))
-        fig_q.update_layout(barmode='group')
-        st.plotly_chart(style_chart(fig_q), use_container_width=True)
-
-    with tab3:
-        st.markdown("<h4 style='color: #2E5A31;'>Annual Performance</h4>", unsafe_allow_html=True)
-        df_annual = get_tracking_data('Annual')
-
-        fig_a = go.Figure()
-        fig_a.add_trace(go.Bar(
-            x=df_annual.index, y=df_annual['Forecasted Yield (kg)'],
-            name='Forecast', marker_color='#4CAF50'
-        ))
-        fig_a.add_trace(go.Bar(
-            x=df_annual.index, y=df_annual['Actual Yield (kg)'],
-            name='Actual', marker_color='#1E88E5'
-        ))
-        fig_a.update_layout(barmode='group')
-        st.plotly_chart(style_chart(fig_a), use_container_width=True)
+    farm = st.session_state.result_cluster
+    model_path = st.session_state.model_path
+    # Tabs track their selection, so only the open tab's data and chart are built on a rerun.
+    tab1, tab2, tab3, tab4 = st.tabs(["Monthly", "Quarterly", "Annual", "Fleet Accuracy"], key="tracking_tab",
+                                     on_change="rerun")
+
+    for tab, period, kind in ((tab1, 'Monthly', 'line'), (tab2, 'Quarterly', 'bar'), (tab3, 'Annual', 'bar')):
+        if not tab.open:
+            continue
+        with tab:
+            st.markdown(f"<h4 style='color: #2E5A31;'>{period} Performance</h4>", unsafe_allow_html=True)
+            fig = session_figure(period, (farm, period, model_path),
+                                 lambda: tracking_figure(get_tracking_data(period, farm, model_path), kind))
+            st.plotly_chart(fig, width="stretch")
+
+    if tab4.open:
+        with tab4:
+            st.markdown("<h4 style='color: #2E5A31;'>Fleet Forecast Accuracy</h4>", unsafe_allow_html=True)
+            by_cluster, drifting = get_fleet_accuracy(model_path)
+            cluster_names = {c: f"Cluster {c + 1}" for c in MOCK_CLUSTERS}
+            columns = {'cluster': 'Cluster', 'period': 'Year', 'farm': 'Farm', 'n': 'Farm-months',
+                       'mape': 'MAPE', 'bias': 'Bias (kg)', 'rmse': 'RMSE (kg)'}
+            formats = {'MAPE': '{:.1%}', 'Bias (kg)': '{:+.1f}', 'RMSE (kg)': '{:.1f}'}
+
+            st.markdown("<p style='color: #333333;'>Error of the monthly forecasts for the farms this model "
+                        "was trained on, by cluster and year.</p>", unsafe_allow_html=True)
+            summary = by_cluster.assign(cluster=by_cluster['cluster'].map(cluster_names)).rename(columns=columns)
+            st.dataframe(summary.style.format(formats), hide_index=True, width="stretch")
+
+            st.markdown("<p style='color: #333333;'>Farms with the highest forecast error in the latest year.</p>",
+                        unsafe_allow_html=True)
+            worst = drifting.assign(cluster=drifting['cluster'].map(cluster_names)).rename(columns=columns)
+            st.dataframe(worst.style.format(formats), hide_index=True, width="stretch")
 
     st.markdown("---")
     if st.button("Back to Resource Plan"):
@@ -534,16 +588,44 @@ st.sidebar.markdown("# Agri-Forecast")
 st.sidebar.markdown("### Proactive Crop & Resource Planning")
 st.sidebar.info("This tool uses unsupervised machine learning (K-Means Clustering & Apriori Association Mining).")
 st.sidebar.markdown("---")
+if REGIONS:
+    # Per-region models come from train.py; the choice applies from the next analysis.
+    st.sidebar.selectbox("Region", REGION_CHOICES, key="region", disabled=st.session_state.step != 1)
 st.sidebar.write(f"**Project Phase:** Step {st.session_state.step} of 4")
 progress_map = {1: 25, 2: 50, 3: 75, 4: 100}
 st.sidebar.progress(progress_map[st.session_state.step])
 
+if RERUN['profile_mode'] or 'timeline' in DERIVED:
+    with st.sidebar.expander("Performance"):
+        timeline = DERIVED.get('timeline', [])
+        if timeline:
+            last = timeline[-1]
+            st.write(f"Last rerun: {last['seconds'] * 1000:.1f} ms")
+            st.dataframe([{"section": e['name'], "ms": round(e['seconds'] * 1000, 2)} for e in last['events']],
+                         hide_index=True)
+            if last.get('profile'):
+                st.code(last['profile'], language=None)
+        st.download_button("Timeline (JSON)", export_json(timeline), "agri-timeline.json", "application/json")
+        st.download_button("Metrics (Prometheus)", export_prometheus(), "agri-metrics.prom", "text/plain")
+        totals = SESSIONS.totals()
+        st.write(f"Sessions: {totals['sessions']}, state {totals['state_bytes'] / 1024:.0f} KiB, "
+                 f"derived {totals['derived_bytes'] / 1024:.0f} KiB, evictions {totals['evicted']}")
+        st.dataframe(SESSIONS.report()[:20], hide_index=True)
+
 # Routing
-if st.session_state.step == 1:
-    render_profile_view()
-elif st.session_state.step == 2:
-    render_zone_view()
-elif st.session_state.step == 3:
-    render_planner_view()
-elif st.session_state.step == 4:
-    render_tracking_view()
\ No newline at end of file
+try:
+    if st.session_state.step == 1:
+        render_profile_view()
+    elif st.session_state.step == 2:
+        render_zone_view()
+    elif st.session_state.step == 3:
+        render_planner_view()
+    elif st.session_state.step == 4:
+        render_tracking_view()
+finally:
+    # Runs on st.rerun() too. The session keeps a short rolling timeline of its reruns.
+    end_rerun(RERUN)
+    if RERUN['profile_mode'] or 'timeline' in DERIVED:
+        DERIVED.setdefault('timeline', []).append(RERUN)
+        del DERIVED['timeline'][:-20]
+    SESSIONS.touch(SESSION_ID, st.session_state.to_dict())
\ No newline at end of file
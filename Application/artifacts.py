@@ -0,0 +1,126 @@
+"""Versioned model artifacts.
+
+An artifact is one block file holding the K-Means centroids, the feature scaler, the cluster
+table and the pre-sorted rule columns, with a SHA-256 checksum in its header. The header also
+records the farm history (and, for a per-region model, the region) the model was trained on, so
+the forecaster and the neighbour index built for an artifact use the same farms. ``CURRENT`` in
+the model directory names the published artifact; publishing rewrites it with an atomic rename, so
+readers switch to a new version between requests without ever seeing a partial file. Models are
+trained and published by ``models.py``.
+"""
+import functools
+import os
+import tempfile
+import time
+
+from blockfile import checksum, read_blocks, write_blocks
+from clustering import KMeansModel
+from history import history_source, load_history, synthetic_history
+from rule_store import RuleStore, rule_arrays
+
+MODEL_DIR = os.environ.get(
+    "AGRI_MODEL_DIR", os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "models")))
+POINTER = "CURRENT"
+REGIONS_DIR = "regions"  # per-region models live in <model dir>/regions/<region>/
+
+
+class ModelArtifact:
+
+    def __init__(self, path, verify=True):
+        meta, arrays = read_blocks(path, verify=verify)
+        self.path = path
+        self.version = meta["version"]
+        self.created = meta["created"]
+        # {"path": file or None for synthetic, "region": region or None for all}; None before it was recorded.
+        self.history = meta.get("history")
+        self.model = KMeansModel.restore(arrays["kmeans.mean"], arrays["kmeans.scale"],
+                                         arrays["kmeans.centers"], arrays["kmeans.counts"])
+        self.clusters = {int(c): info for c, info in meta["clusters"].items()}
+        self.rules = RuleStore({name[len("rules."):]: value for name, value in arrays.items()
+                                if name.startswith("rules.")}, meta["rules"])
+
+
+def save_artifact(model, clusters, rule_table, model_dir=MODEL_DIR, publish=True, history=None):
+    rule_columns, rule_meta = rule_arrays(rule_table)
+    arrays = {
+        "kmeans.mean": model.mean_,
+        "kmeans.scale": model.scale_,
+        "kmeans.centers": model.centers_,
+        "kmeans.counts": model.counts_,
+        **{f"rules.{name}": value for name, value in rule_columns.items()},
+    }
+    created = time.strftime("%Y%m%dT%H%M%S")
+    version = f"{created}-{checksum(arrays.values())[:12]}"
+    path = os.path.join(model_dir, f"model-{version}.agb")
+    write_blocks(path, arrays, meta={"version": version, "created": created, "clusters": clusters,
+                                     "rules": rule_meta, "history": history or {"path": None}})
+    if publish:
+        publish_artifact(path, model_dir)
+    return path
+
+
+def publish_artifact(path, model_dir=MODEL_DIR):
+    fd, tmp_path = tempfile.mkstemp(dir=model_dir, suffix=".tmp")
+    with os.fdopen(fd, "w") as fh:
+        fh.write(os.path.basename(path))
+    os.replace(tmp_path, os.path.join(model_dir, POINTER))
+
+
+def current_artifact_path(model_dir=MODEL_DIR):
+    # Path of the published artifact. Training takes a while, so it is never started implicitly here.
+    try:
+        with open(os.path.join(model_dir, POINTER)) as fh:
+            return os.path.join(model_dir, fh.read().strip())
+    except FileNotFoundError:
+        raise FileNotFoundError(f"no model published in {model_dir}; train one first with "
+                                f"`python models.py` (or `python train.py` for per-region models)") from None
+
+
+def training_source(artifact):
+    """{"path", "region"} of the farm records `artifact` was trained on; None means synthetic / all regions.
+
+    Artifacts that predate the record are taken to use load_history()'s source, and a model under
+    regions/<region>/ to be that region's.
+    """
+    if artifact.history is not None:
+        return {"path": artifact.history.get("path"), "region": artifact.history.get("region")}
+    parent = os.path.dirname(os.path.abspath(artifact.path))
+    is_region = os.path.basename(os.path.dirname(parent)) == REGIONS_DIR
+    return {"path": history_source(), "region": os.path.basename(parent) if is_region else None}
+
+
+def training_history(artifact):
+    # The farm records `artifact` was trained on: its history file (or the synthetic one), limited to its region.
+    source = training_source(artifact)
+    if source["path"] and not os.path.exists(source["path"]):
+        raise FileNotFoundError(f"history {source['path']} of model {artifact.version} no longer exists")
+    history = load_history(source["path"]) if source["path"] else synthetic_history()
+    if source["region"] is not None and "region" in history:
+        history = history[history["region"].astype(str) == source["region"]].reset_index(drop=True)
+    return history
+
+
+def region_model_dir(region, model_dir=MODEL_DIR):
+    return os.path.join(model_dir, REGIONS_DIR, str(region))
+
+
+def is_published(model_dir=MODEL_DIR):
+    return os.path.exists(os.path.join(model_dir, POINTER))
+
+
+def available_regions(model_dir=MODEL_DIR):
+    # Regions with a published model, in name order.
+    root = os.path.join(model_dir, REGIONS_DIR)
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root) if is_published(os.path.join(root, name)))
+
+
+@functools.lru_cache(maxsize=2)
+def load_artifact(path):
+    # Process-wide cache for headless callers; the Streamlit app uses st.cache_resource instead.
+    return ModelArtifact(path)
+
+
+def current_artifact(model_dir=MODEL_DIR):
+    return load_artifact(current_artifact_path(model_dir))
@@ -0,0 +1,117 @@
+"""Headless bulk classification of farm profiles.
+
+Usage: python batch_score.py soil_tests.csv -o scored.csv [--chunksize 200000]
+
+Input rows carry the same fields as the app's ``user_data`` (N, P, K, ph, temp,
+humidity, rainfall, irrigation); any other columns such as a farm ID are passed through.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from artifacts import current_artifact, load_artifact
+from clustering import FEATURES
+from core import Recommender
+
+COLUMN_ALIASES = {'rain': 'rainfall', 'hum': 'humidity'}
+
+
+class BatchScorer:
+    # Per-cluster lookups are precomputed so scoring a chunk is one distance call plus array takes.
+
+    def __init__(self, artifact):
+        self.recommender = recommender = Recommender(artifact)
+        self.version = artifact.version
+        ids = range(recommender.model.n_clusters)
+        crops = [recommender.clusters[c]['crop'] for c in ids]
+        baskets = ["; ".join(recommender.items[c]) for c in ids]
+        # Clusters can share a crop, so map cluster IDs onto unique category codes.
+        self.crop_codes, self.crop_names = pd.factorize(pd.Series(crops, dtype=object))
+        self.basket_codes, self.basket_names = pd.factorize(pd.Series(baskets, dtype=object))
+
+    def score(self, frame):
+        frame = frame.rename(columns=COLUMN_ALIASES)
+        cluster, match = self.recommender.assign(frame)
+
+        passthrough = frame.drop(columns=[c for c in FEATURES if c in frame.columns])
+        scored = pd.DataFrame({
+            'cluster': cluster,
+            'crop': pd.Categorical.from_codes(self.crop_codes[cluster], categories=self.crop_names),
+            'match_score': np.round(match, 4),
+            'resource_basket': pd.Categorical.from_codes(self.basket_codes[cluster], categories=self.basket_names),
+            # Cluster IDs only mean something for this model; demand.py checks it before trusting them.
+            'model_version': pd.Categorical.from_codes(np.zeros(len(frame), np.int8), categories=[self.version]),
+        }, index=frame.index)
+        return pd.concat([passthrough, scored], axis=1)
+
+
+def iter_chunks(path, chunksize=200_000):
+    # Stream the input so memory stays flat regardless of file size.
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.parquet':
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    elif ext in ('.jsonl', '.ndjson'):
+        yield from pd.read_json(path, lines=True, chunksize=chunksize)
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize)
+
+
+def score_file(path, scorer=None, chunksize=200_000):
+    if scorer is None:
+        scorer = BatchScorer(current_artifact())
+    for chunk in iter_chunks(path, chunksize):
+        yield scorer.score(chunk)
+
+
+def write_scores(chunks, output):
+    rows = 0
+    if output.lower().endswith('.parquet'):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            writer = writer or pq.ParquetWriter(output, table.schema)
+            writer.write_table(table)
+            rows += len(chunk)
+        if writer is not None:
+            writer.close()
+        return rows
+
+    for i, chunk in enumerate(chunks):
+        chunk.to_csv(output, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+        rows += len(chunk)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-classify farm profiles into clusters and resource plans.")
+    parser.add_argument('input', help="CSV, JSON-lines or Parquet file of farm profiles")
+    parser.add_argument('-o', '--output', default='-', help="CSV or Parquet output path (default: stdout)")
+    parser.add_argument('--chunksize', type=int, default=200_000)
+    parser.add_argument('--model', help="Model artifact to score with (default: the published version)")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    scorer = BatchScorer(load_artifact(args.model) if args.model else current_artifact())
+    chunks = score_file(args.input, scorer=scorer, chunksize=args.chunksize)
+    if args.output == '-':
+        rows = 0
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(sys.stdout, header=(i == 0), index=False)
+            rows += len(chunk)
+    else:
+        rows = write_scores(chunks, args.output)
+    elapsed = time.perf_counter() - start
+    print(f"Scored {rows} rows in {elapsed:.2f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
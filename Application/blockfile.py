@@ -0,0 +1,83 @@
+"""Single-file container of named NumPy arrays, readable as zero-copy memory maps.
+
+Layout: 8-byte magic, 8-byte little-endian header length, a JSON header (free-form ``meta``
+plus dtype/shape/offset of every array), then the raw array bytes, each 64-byte aligned.
+Because readers map the file read-only, every process opening the same file shares one copy
+in the OS page cache. The header carries a SHA-256 of the array bytes for integrity checks.
+"""
+import hashlib
+import json
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+MAGIC = b"AGRIBLK1"
+ALIGN = 64
+
+
+def _aligned(offset):
+    return -(-offset // ALIGN) * ALIGN
+
+
+def write_blocks(path, arrays, meta=None):
+    arrays = {name: np.ascontiguousarray(value) for name, value in arrays.items()}
+    layout, offset = {}, 0
+    for name, value in arrays.items():
+        layout[name] = {"dtype": value.dtype.str, "shape": list(value.shape), "offset": offset}
+        offset = _aligned(offset + value.nbytes)
+    digest = checksum(arrays.values())
+    header = json.dumps({"meta": meta or {}, "arrays": layout, "sha256": digest}).encode("utf-8")
+    data_start = _aligned(16 + len(header))
+
+    # Write to a sibling temp file and rename, so readers never see a half-written file.
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(MAGIC + struct.pack("<Q", len(header)) + header)
+            for name, value in arrays.items():
+                fh.seek(data_start + layout[name]["offset"])
+                fh.write(value.tobytes())
+            fh.truncate(data_start + offset)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return digest
+
+
+def checksum(arrays):
+    hasher = hashlib.sha256()
+    for value in arrays:
+        if value.size:
+            hasher.update(memoryview(np.ascontiguousarray(value)).cast("B"))
+    return hasher.hexdigest()
+
+
+def read_header(path):
+    with open(path, "rb") as fh:
+        if fh.read(8) != MAGIC:
+            raise ValueError(f"{path} is not a block file")
+        (length,) = struct.unpack("<Q", fh.read(8))
+        header = json.loads(fh.read(length).decode("utf-8"))
+    return header, _aligned(16 + length)
+
+
+def read_blocks(path, verify=False):
+    # Returns (meta, {name: read-only memmap}). With verify=True the array bytes are checked
+    # against the header checksum, which reads the whole file once.
+    header, data_start = read_header(path)
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype, shape = np.dtype(spec["dtype"]), tuple(spec["shape"])
+        if int(np.prod(shape)) == 0:
+            arrays[name] = np.empty(shape, dtype=dtype)
+        else:
+            arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=data_start + spec["offset"], shape=shape)
+    if verify and checksum(arrays.values()) != header.get("sha256"):
+        raise ValueError(f"{path} failed its checksum")
+    return header["meta"], arrays
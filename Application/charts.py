@@ -0,0 +1,164 @@
+"""Plotly figures for the views, built from shared layout templates.
+
+The app caches charts as serialized specs (``chart_spec``), keyed by the exact values they plot,
+so an unchanged rerun or another session showing the same cluster neither rebuilds nor
+re-serializes the figure. ``ChartSpec`` hands such a spec back to ``st.plotly_chart``.
+"""
+import functools
+import json
+
+import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.subplots import make_subplots
+
+FORECAST_COLOR, ACTUAL_COLOR, NEIGHBOUR_COLOR = '#4CAF50', '#1E88E5', '#FB8C00'
+CROP_COLORS = ['#4CAF50', '#1E88E5', '#FB8C00', '#8E24AA', '#6D4C41', '#00897B', '#C0CA33', '#E53935']
+
+# --- LAYOUT TEMPLATES ---
+RADAR_LAYOUT = dict(
+    polar=dict(radialaxis=dict(visible=True, range=[0, 150], gridcolor='#E0E0E0')),
+    showlegend=True,
+    margin=dict(l=40, r=40, t=20, b=20),
+    height=350,
+    paper_bgcolor='white',
+    plot_bgcolor='white',
+    font=dict(color="#333333")
+)
+
+# Common styling for all tracking charts
+_AXIS = dict(showgrid=True, gridcolor='#f0f0f0', linecolor='black', tickfont=dict(color='black'))
+TRACKING_LAYOUT = dict(
+    paper_bgcolor='white',  # Force White Background (Outside)
+    plot_bgcolor='white',  # Force White Background (Inside)
+    font=dict(color='black'),  # Force All Text to Black
+    xaxis=_AXIS,
+    yaxis=_AXIS,
+    legend=dict(font=dict(color='black'), bgcolor='rgba(255,255,255,0.5)'),
+    margin=dict(l=40, r=40, t=20, b=20)
+)
+
+RADAR_CATEGORIES = [
+    '<span style="color:#2E5A31"><b>Nitrogen</b></span>',
+    '<span style="color:#2E5A31"><b>Phosphorus</b></span>',
+    '<span style="color:#2E5A31"><b>Potassium</b></span>',
+    '<span style="color:#2E5A31"><b>pH</b></span>',
+    '<span style="color:#000080"><b>Temp</b></span>'
+]
+
+
+@functools.lru_cache(maxsize=None)
+def layout_template(name, **overrides):
+    # Validated once per process; figures start from a copy instead of re-validating the dicts.
+    spec = {'radar': RADAR_LAYOUT, 'tracking': TRACKING_LAYOUT}[name]
+    return go.Layout({**spec, **overrides})
+
+
+def chart_spec(fig):
+    # The figure as a JSON string: immutable, so one copy can be shared by every session.
+    return pio.to_json(fig, validate=False)
+
+
+class ChartSpec(go.Figure):
+    """A figure serialized by ``chart_spec``, for ``st.plotly_chart``.
+
+    Streamlit reads a figure through ``to_dict()``, which here decodes the stored spec instead of
+    copying and re-encoding a full ``go.Figure``. Each call returns a fresh dict, so a caller
+    cannot change the shared spec. The object itself is empty apart from that.
+    """
+
+    def __init__(self, spec):
+        super().__init__()
+        self._spec = spec
+
+    def to_dict(self):
+        return json.loads(self._spec)
+
+
+def radar_axes(profile):
+    # Radar coordinates of a profile: N, P, K as-is, pH x10 and temp x2 to share the 0-150 scale.
+    return (profile['N'], profile['P'], profile['K'], profile['ph'] * 10, profile['temp'] * 2)
+
+
+def radar_figure(cluster_r, user_r, neighbour_r=None):
+    # `neighbour_r`: optional (25th, 50th, 75th percentile) radar coordinates of similar farms.
+    fig = go.Figure(layout=layout_template('radar'))
+    fig.add_trace(go.Scatterpolar(
+        r=list(cluster_r), theta=RADAR_CATEGORIES, fill='toself', name='Ideal Cluster Average',
+        line_color='#4CAF50', fillcolor='rgba(76, 175, 80, 0.4)'
+    ))
+    fig.add_trace(go.Scatterpolar(
+        r=list(user_r), theta=RADAR_CATEGORIES, fill='toself', name='Your Farm Profile',
+        line_color='#1E88E5', fillcolor='rgba(30, 136, 229, 0.2)'
+    ))
+    if neighbour_r is not None:
+        low, mid, high = neighbour_r
+        fig.add_trace(go.Scatterpolar(
+            r=list(mid), theta=RADAR_CATEGORIES, name='Similar Farms (median)',
+            line=dict(color=NEIGHBOUR_COLOR, width=2, dash='dash')
+        ))
+        for r, show in ((low, True), (high, False)):
+            fig.add_trace(go.Scatterpolar(
+                r=list(r), theta=RADAR_CATEGORIES, name='Similar Farms (25th-75th pct)', legendgroup='iqr',
+                showlegend=show, line=dict(color=NEIGHBOUR_COLOR, width=1, dash='dot')
+            ))
+    return fig
+
+
+def tracking_figure(frame, kind):
+    # Forecast vs actual chart for a tracking frame; `kind` is 'line' or 'bar'.
+    periods = list(frame.index)
+    forecast, actual = frame['Forecasted Yield (kg)'].tolist(), frame['Actual Yield (kg)'].tolist()
+    if kind == 'line':
+        fig = go.Figure(layout=layout_template('tracking'))
+        fig.add_trace(go.Scatter(x=periods, y=forecast, mode='lines+markers', name='Forecast',
+                                 line=dict(color=FORECAST_COLOR, width=3)))
+        fig.add_trace(go.Scatter(x=periods, y=actual, mode='lines+markers', name='Actual',
+                                 line=dict(color=ACTUAL_COLOR, width=3)))
+    else:
+        fig = go.Figure(layout=layout_template('tracking', barmode='group'))
+        fig.add_trace(go.Bar(x=periods, y=forecast, name='Forecast', marker_color=FORECAST_COLOR))
+        fig.add_trace(go.Bar(x=periods, y=actual, name='Actual', marker_color=ACTUAL_COLOR))
+    return fig
+
+
+def scenario_figure(sweep, x, y):
+    # Decision-boundary map over (x, y) next to the sensitivity table of a scenario.Sweep, in one figure.
+    crop, clusters, agreement = sweep.boundary_map(x, y)
+    xs, ys = sweep.axes[sweep.features.index(x)], sweep.axes[sweep.features.index(y)]
+    n = len(sweep.crops)
+    colorscale = []
+    for code in range(n):
+        color = CROP_COLORS[code % len(CROP_COLORS)]
+        colorscale += [[code / n, color], [(code + 1) / n, color]]
+    hover = [[f"{sweep.crops[c]} ({sweep.zones[z]})<br>{a:.0%} of other scenarios agree"
+              for c, z, a in zip(crop_row, zone_row, agree_row)]
+             for crop_row, zone_row, agree_row in zip(crop, clusters, agreement)]
+
+    fig = make_subplots(rows=1, cols=2, column_widths=[0.55, 0.45], horizontal_spacing=0.08,
+                        specs=[[{'type': 'xy'}, {'type': 'table'}]])
+    fig.add_trace(go.Heatmap(
+        x=xs, y=ys, z=crop + 0.5, zmin=0, zmax=n, colorscale=colorscale, text=hover,
+        hovertemplate=f"{x}=%{{x:.3g}}, {y}=%{{y:.3g}}<br>%{{text}}<extra></extra>",
+        colorbar=dict(tickvals=[code + 0.5 for code in range(n)], ticktext=sweep.crops, len=0.8, x=0.5)
+    ), row=1, col=1)
+    fig.add_trace(go.Scatter(
+        x=[sweep.base[x]], y=[sweep.base[y]], mode='markers', name='Your Farm Profile', showlegend=False,
+        marker=dict(color='white', size=12, symbol='x', line=dict(color='black', width=2))
+    ), row=1, col=1)
+
+    table = sweep.sensitivity()
+    fmt = lambda v: '-' if v != v else f"{v:g}"
+    fig.add_trace(go.Table(
+        header=dict(values=['<b>Feature</b>', '<b>Swept range</b>', '<b>Keeps crop</b>', '<b>Keeps basket</b>',
+                            '<b>Changes below</b>', '<b>Changes above</b>'],
+                    fill_color='#2E5A31', font=dict(color='white')),
+        cells=dict(values=[table['feature'], table['range'], [f"{v:.0%}" for v in table['keeps_crop']],
+                           [f"{v:.0%}" for v in table['keeps_basket']], [fmt(v) for v in table['flips_below']],
+                           [fmt(v) for v in table['flips_above']]],
+                   fill_color='white', font=dict(color='black'), height=26)
+    ), row=1, col=2)
+    fig.update_xaxes(title_text=x, **_AXIS, row=1, col=1)
+    fig.update_yaxes(title_text=y, **_AXIS, row=1, col=1)
+    fig.update_layout(paper_bgcolor='white', plot_bgcolor='white', font=dict(color='black'), height=380,
+                      margin=dict(l=40, r=20, t=20, b=40))
+    return fig
@@ -0,0 +1,216 @@
+import numpy as np
+import pandas as pd
+
+from history import ZONE_ARCHETYPES, load_history, parse_irrigation
+
+FEATURES = ['N', 'P', 'K', 'ph', 'temp', 'humidity', 'rainfall', 'irrigation']
+
+
+def encode_profiles(profiles):
+    # Profile dict(s) or DataFrame -> float matrix in FEATURES order. Irrigation accepts Yes/No.
+    if isinstance(profiles, dict):
+        profiles = pd.DataFrame([profiles])
+    columns = []
+    for feature in FEATURES:
+        col = profiles[feature]
+        if feature == 'irrigation':
+            col = parse_irrigation(col)
+        columns.append(np.asarray(col, dtype=np.float64))
+    return np.column_stack(columns)
+
+
+def squared_distances(X, centers):
+    xx = np.einsum('ij,ij->i', X, X)[:, None]
+    cc = np.einsum('ij,ij->i', centers, centers)[None, :]
+    return np.maximum(xx - 2.0 * (X @ centers.T) + cc, 0.0)
+
+
+def kmeans_plusplus(X, n_clusters, rng, n_trials=None):
+    # Greedy k-means++: sample a few candidates per step and keep the one that lowers potential most.
+    n_trials = n_trials or 2 + int(np.log(n_clusters))
+    centers = np.empty((n_clusters, X.shape[1]))
+    centers[0] = X[rng.integers(len(X))]
+    closest = squared_distances(X, centers[:1])[:, 0]
+    for c in range(1, n_clusters):
+        total = closest.sum()
+        if total <= 0:
+            centers[c:] = centers[0]
+            break
+        candidates = np.searchsorted(np.cumsum(closest), rng.random(n_trials) * total)
+        candidates = np.minimum(candidates, len(X) - 1)
+        trial = np.minimum(closest[:, None], squared_distances(X, X[candidates]))
+        best = np.argmin(trial.sum(axis=0))
+        centers[c] = X[candidates[best]]
+        closest = trial[:, best]
+    return centers
+
+
+def lloyd(X, centers, n_iter=10):
+    # Full-batch refinement, used on the seeding sample only.
+    for _ in range(n_iter):
+        labels = np.argmin(squared_distances(X, centers), axis=1)
+        counts = np.bincount(labels, minlength=len(centers))
+        sums = np.column_stack([np.bincount(labels, weights=X[:, j], minlength=len(centers))
+                                for j in range(X.shape[1])])
+        hit = counts > 0
+        centers = centers.copy()
+        centers[hit] = sums[hit] / counts[hit, None]
+    inertia = squared_distances(X, centers).min(axis=1).sum()
+    return centers, inertia
+
+
+class KMeansModel:
+    """Mini-batch K-Means over standardized profile features with k-means++ seeding."""
+
+    def __init__(self, n_clusters=3, batch_size=4096, max_iter=200, tol=1e-4, n_init=3, seed=0):
+        self.n_clusters = n_clusters
+        self.n_init = n_init
+        self.batch_size = batch_size
+        self.max_iter = max_iter
+        self.tol = tol
+        self.rng = np.random.default_rng(seed)
+        self.mean_ = None
+        self.scale_ = None
+        self.centers_ = None
+        self.counts_ = None
+
+    @classmethod
+    def restore(cls, mean, scale, centers, counts):
+        # Rebuild a fitted model from stored arrays (e.g. the memory-mapped columns of an artifact).
+        model = cls(n_clusters=len(centers))
+        model.mean_, model.scale_ = np.asarray(mean), np.asarray(scale)
+        model.counts_ = np.array(counts, dtype=np.int64)
+        model._set_centers(np.asarray(centers, dtype=np.float64))
+        return model
+
+    def _scale(self, X):
+        return (X - self.mean_) / self.scale_
+
+    def _set_centers(self, centers):
+        self.centers_ = centers
+        # Precomputed terms so online assignment is a single matmul + argmin.
+        self._neg2_ct = -2.0 * centers.T
+        self._cc = np.einsum('ij,ij->i', centers, centers)
+
+    def _step(self, Xb):
+        labels = np.argmin(Xb @ self._neg2_ct + self._cc, axis=1)
+        batch_counts = np.bincount(labels, minlength=self.n_clusters)
+        sums = np.column_stack([np.bincount(labels, weights=Xb[:, j], minlength=self.n_clusters)
+                                for j in range(Xb.shape[1])])
+        self.counts_ += batch_counts
+        hit = batch_counts > 0
+        centers = self.centers_.copy()
+        # Per-centre learning rate 1/count (Sculley, 2010), applied to the whole batch at once.
+        centers[hit] += (sums[hit] - batch_counts[hit, None] * centers[hit]) / self.counts_[hit, None]
+        shift = np.sum((centers - self.centers_) ** 2)
+        self._set_centers(centers)
+        return shift
+
+    def fit(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        self.mean_ = X.mean(axis=0)
+        self.scale_ = X.std(axis=0)
+        self.scale_[self.scale_ == 0] = 1.0
+        Xs = self._scale(X)
+
+        seed_size = min(len(Xs), max(20 * self.batch_size, 10000))
+        seed_rows = Xs[self.rng.choice(len(Xs), seed_size, replace=False)]
+        starts = [lloyd(seed_rows, kmeans_plusplus(seed_rows, self.n_clusters, self.rng))
+                  for _ in range(self.n_init)]
+        self._set_centers(min(starts, key=lambda start: start[1])[0])
+        self.counts_ = np.zeros(self.n_clusters, dtype=np.int64)
+
+        quiet = 0
+        for _ in range(self.max_iter):
+            batch = Xs[self.rng.integers(0, len(Xs), self.batch_size)]
+            shift = self._step(batch)
+            quiet = quiet + 1 if shift < self.tol else 0
+            if quiet >= 10:
+                break
+        return self
+
+    def partial_fit(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if self.centers_ is None:
+            return self.fit(X)
+        self._step(self._scale(X))
+        return self
+
+    def transform(self, X):
+        # Squared distances to every centroid, in standardized units.
+        return squared_distances(self._scale(np.asarray(X, dtype=np.float64)), self.centers_)
+
+    def predict(self, X):
+        Xs = self._scale(np.asarray(X, dtype=np.float64))
+        return np.argmin(Xs @ self._neg2_ct + self._cc, axis=1)
+
+    @property
+    def cluster_centers_(self):
+        # Centroids in the original feature units.
+        return self.centers_ * self.scale_ + self.mean_
+
+
+def fit_cluster_model(history, n_clusters=3, seed=0):
+    return KMeansModel(n_clusters=n_clusters, seed=seed).fit(encode_profiles(history))
+
+
+def _name_clusters(model):
+    archetypes = encode_profiles(pd.DataFrame(ZONE_ARCHETYPES))
+    dist = squared_distances(model.centers_, model._scale(archetypes))
+    names = {}
+    # Greedy one-to-one matching of centroids to archetypes, closest pairs first.
+    for flat in np.argsort(dist, axis=None):
+        c, a = np.unravel_index(flat, dist.shape)
+        if c not in names and ZONE_ARCHETYPES[a]['name'] not in names.values():
+            names[c] = ZONE_ARCHETYPES[a]['name']
+    for c in range(model.n_clusters):
+        names.setdefault(c, f"Zone {c + 1}")
+    return names
+
+
+def build_cluster_table(model, history):
+    X = encode_profiles(history)
+    labels = model.predict(X)
+    dist = np.sqrt(np.sort(model.transform(X), axis=1))
+    # Simplified silhouette: how much closer members sit to their own centroid than to the next one.
+    cohesion = 1.0 - dist[:, 0] / np.maximum(dist[:, 1], 1e-12)
+
+    # Crops differ in absolute yield, so rank them by yield relative to the crop's own average.
+    relative = history['yield'] / history.groupby('crop')['yield'].transform('mean')
+    yields = relative.groupby([labels, history['crop']]).mean()
+    names = _name_clusters(model)
+    centers = model.cluster_centers_
+
+    # An empty cluster takes the crop of the nearest cluster with farms, so every entry has one.
+    populated = np.unique(labels)
+    gaps = ((model.centers_[:, None, :] - model.centers_[None, populated, :]) ** 2).sum(axis=2)
+    nearest = populated[np.argmin(gaps, axis=1)]
+    table = {}
+    for c in range(model.n_clusters):
+        member = labels == c
+        crop = yields.loc[nearest[c]].idxmax()
+        table[c] = {
+            "name": names[c],
+            "crop": crop,
+            **centroid_averages(centers[c]),
+            "match": f"{cohesion[member].mean():.0%}" if member.any() else "n/a",
+        }
+    return table
+
+
+def centroid_averages(center):
+    # The avg_* fields of a cluster table entry, from a centroid in original units.
+    avg = dict(zip(FEATURES, center))
+    return {
+        "avg_n": int(round(avg['N'])),
+        "avg_p": int(round(avg['P'])),
+        "avg_k": int(round(avg['K'])),
+        "avg_ph": round(float(avg['ph']), 1),
+        "avg_temp": round(float(avg['temp']), 1),
+    }
+
+
+def load_cluster_model(history=None):
+    history = load_history() if history is None else history
+    model = fit_cluster_model(history)
+    return model, build_cluster_table(model, history)
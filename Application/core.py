@@ -0,0 +1,95 @@
+"""UI-free recommendation core: profile -> cluster -> crop -> resource plan.
+
+Shared by the Streamlit app, the batch scorer and the HTTP service. Everything that depends only
+on the cluster (zone info, basket, key actions) is precomputed once per model artifact, so
+scoring is one vectorized distance call followed by table lookups.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+from clustering import FEATURES, encode_profiles
+from rules import basket_items, key_actions, select_basket
+
+
+def assign(model, X):
+    # Nearest cluster per row, and the cohesion match score 1 - d(own) / d(runner-up).
+    dist = model.transform(X)
+    cluster = np.argmin(dist, axis=1)
+    if dist.shape[1] < 2:
+        return cluster, np.ones(len(cluster))
+    nearest = np.sqrt(np.partition(dist, 1, axis=1)[:, :2])
+    return cluster, 1.0 - nearest[:, 0] / np.maximum(nearest[:, 1], 1e-12)
+
+
+def missing_fields(profile):
+    # Profile fields a request left out; the service reports them instead of failing the batch.
+    return [feature for feature in FEATURES if feature not in profile]
+
+
+def _valid_irrigation(value):
+    # 0/1, a bool, or yes/no/true/false.
+    if isinstance(value, str) and value.strip().lower() in ('yes', 'no', 'true', 'false'):
+        return True
+    try:
+        return float(value) in (0.0, 1.0)
+    except (TypeError, ValueError):
+        return False
+
+
+def invalid_fields(profile):
+    # Fields present with a value that is not a finite number, or for irrigation not 0/1 (or yes/no, true/false).
+    invalid = []
+    for feature in FEATURES:
+        if feature not in profile:
+            continue
+        value = profile[feature]
+        if feature == 'irrigation':
+            valid = _valid_irrigation(value)
+        else:
+            try:
+                valid = not isinstance(value, bool) and math.isfinite(float(value))
+            except (TypeError, ValueError):
+                valid = False
+        if not valid:
+            invalid.append(feature)
+    return invalid
+
+
+class Recommender:
+
+    def __init__(self, artifact, basket_size=4):
+        self.version = artifact.version
+        self.model = artifact.model
+        self.clusters = artifact.clusters
+        ids = range(self.model.n_clusters)
+        self.baskets = {c: select_basket(artifact.rules.top_k(c, self.clusters[c]['crop'], k=20), k=basket_size)
+                        for c in ids}
+        self.actions = {c: key_actions(self.baskets[c]) for c in ids}
+        self.items = {c: basket_items(self.baskets[c]) for c in ids}
+
+    def assign(self, profiles):
+        return assign(self.model, encode_profiles(profiles))
+
+    def recommend_batch(self, profiles):
+        # Profiles as a list of dicts or a DataFrame -> one recommendation dict per profile.
+        if isinstance(profiles, list):
+            profiles = pd.DataFrame({feature: [p[feature] for p in profiles] for feature in FEATURES})
+        cluster, match = self.assign(profiles)
+        return [self._recommendation(int(c), float(m)) for c, m in zip(cluster, match)]
+
+    def recommend(self, profile):
+        return self.recommend_batch([profile])[0]
+
+    def _recommendation(self, cluster, match):
+        info = self.clusters[cluster]
+        return {
+            "cluster": cluster,
+            "zone": info['name'],
+            "crop": info['crop'],
+            "match_score": round(match, 4),
+            "resource_basket": self.items[cluster],
+            "key_actions": self.actions[cluster],
+            "model_version": self.version,
+        }
@@ -0,0 +1,274 @@
+"""Partitioned, columnar store of historical farm records with predicate pushdown.
+
+Usage:
+    python dataset.py build [--history farms.csv] [--root ../data/farms]
+    python dataset.py query --where cluster=2 --where crop=Maize --columns farm_id,yield --top 0.25
+
+Layout: ``<root>/season=2024/region=North/cluster=2/part-00000.agb`` block files, one memory-mappable
+array per column, plus ``<root>/manifest.json`` listing every part with its row count and a zone map
+(min/max of each column). String columns are dictionary-encoded with dataset-wide dictionaries kept
+in the manifest, so a string predicate becomes an integer comparison. A query:
+
+1. prunes partitions whose key values cannot match (partition pruning),
+2. skips parts whose zone map rules the predicate out (zone-map pruning),
+3. evaluates the remaining predicates on the memory-mapped predicate columns only, then
+4. gathers just the requested columns at the matching rows (column pruning).
+
+Unfiltered scans hand out the memory maps themselves, without copying.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from blockfile import read_blocks, write_blocks
+
+DATASET_DIR = os.environ.get(
+    "AGRI_DATASET_DIR", os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "farms")))
+MANIFEST = "manifest.json"
+PARTITION_BY = ("season", "region", "cluster")
+OPS = {
+    "==": np.equal, "!=": np.not_equal, "<": np.less, "<=": np.less_equal, ">": np.greater, ">=": np.greater_equal,
+    "in": lambda values, options: np.isin(values, options),
+}
+
+
+def _encode(frame, dictionaries):
+    # Frame -> {column: ndarray}; string columns become int32 codes into (growing) dataset dictionaries.
+    columns = {}
+    for name in frame.columns:
+        col = frame[name]
+        if pd.api.types.is_numeric_dtype(col) or pd.api.types.is_bool_dtype(col):
+            columns[name] = col.to_numpy()
+            continue
+        values = dictionaries.setdefault(name, [])
+        lookup = {value: code for code, value in enumerate(values)}
+        distinct = pd.unique(col.fillna("").astype(str))
+        for value in distinct:
+            if value not in lookup:
+                lookup[value] = len(values)
+                values.append(value)
+        columns[name] = col.fillna("").astype(str).map(lookup).to_numpy(np.int32)
+    return columns
+
+
+def _zone_map(columns):
+    zones = {}
+    for name, values in columns.items():
+        if len(values) and values.dtype.kind in "biuf":
+            zones[name] = [float(np.nanmin(values)), float(np.nanmax(values))]
+    return zones
+
+
+def _write_manifest(root, manifest):
+    fd, tmp_path = tempfile.mkstemp(dir=root, suffix=".tmp")
+    with os.fdopen(fd, "w") as fh:
+        json.dump(manifest, fh)
+    os.replace(tmp_path, os.path.join(root, MANIFEST))
+
+
+def write_dataset(frame, root=DATASET_DIR, partition_by=PARTITION_BY, max_rows=1_000_000, append=False):
+    """Write ``frame`` as partitioned block-file parts under ``root`` and return the manifest.
+
+    Rows are sorted by any string columns inside each partition, so their zone maps also prune.
+    With ``append=True`` the parts are added to an existing dataset (dictionaries only grow, so
+    existing codes stay valid); otherwise the manifest is replaced.
+    """
+    os.makedirs(root, exist_ok=True)
+    manifest = {"partition_by": list(partition_by), "dictionaries": {}, "parts": []}
+    if append and os.path.exists(os.path.join(root, MANIFEST)):
+        manifest = Dataset.open(root).manifest
+    partition_by = manifest["partition_by"]
+    frame = frame.assign(**{key: "unknown" for key in partition_by if key not in frame})
+    strings = [c for c in frame.columns if c not in partition_by and not pd.api.types.is_numeric_dtype(frame[c])]
+    serial = len(manifest["parts"])
+
+    for keys, part in frame.groupby(list(partition_by), sort=True):
+        keys = keys if isinstance(keys, tuple) else (keys,)
+        values = {key: (value.item() if hasattr(value, "item") else value) for key, value in zip(partition_by, keys)}
+        directory = os.path.join(*[f"{key}={value}" for key, value in values.items()])
+        part = part.drop(columns=list(partition_by))
+        if strings:
+            part = part.sort_values(strings, kind="stable")
+        for start in range(0, len(part), max_rows):
+            columns = _encode(part.iloc[start:start + max_rows], manifest["dictionaries"])
+            path = os.path.join(directory, f"part-{serial:05d}.agb")
+            write_blocks(os.path.join(root, path), columns)
+            manifest["parts"].append({"path": path, "partition": values, "rows": len(next(iter(columns.values()))),
+                                      "zones": _zone_map(columns)})
+            serial += 1
+    _write_manifest(root, manifest)
+    return manifest
+
+
+class Dataset:
+
+    def __init__(self, root, manifest):
+        self.root = root
+        self.manifest = manifest
+        self.partition_by = manifest["partition_by"]
+        self.dictionaries = manifest["dictionaries"]
+
+    @classmethod
+    def open(cls, root=DATASET_DIR):
+        with open(os.path.join(root, MANIFEST)) as fh:
+            return cls(root, json.load(fh))
+
+    def __len__(self):
+        return sum(part["rows"] for part in self.manifest["parts"])
+
+    def _bind(self, where):
+        # Predicates as (column, op, value) with string values translated to dictionary codes.
+        bound = []
+        for column, op, value in where:
+            if op not in OPS:
+                raise ValueError(f"unsupported operator {op!r}")
+            if column in self.dictionaries:
+                codes = {v: c for c, v in enumerate(self.dictionaries[column])}
+                if op == "in":
+                    value = [codes.get(v, -1) for v in value]
+                elif op in ("==", "!="):
+                    value = codes.get(value, -1)
+                else:
+                    raise ValueError(f"{column} is a string column; use ==, != or in")
+            bound.append((column, op, value))
+        return bound
+
+    @staticmethod
+    def _may_match(low, high, op, value):
+        if op == "==":
+            return low <= value <= high
+        if op == "in":
+            return any(low <= v <= high for v in value)
+        if op == "<":
+            return low < value
+        if op == "<=":
+            return low <= value
+        if op == ">":
+            return high > value
+        if op == ">=":
+            return high >= value
+        return not (low == high == value)
+
+    def parts(self, where=()):
+        # Manifest entries that survive partition and zone-map pruning.
+        bound = self._bind(where)
+        for part in self.manifest["parts"]:
+            keep = True
+            for column, op, value in bound:
+                if column in part["partition"]:
+                    keep = bool(OPS[op](np.array([part["partition"][column]]), value)[0])
+                elif column in part["zones"]:
+                    keep = self._may_match(*part["zones"][column], op, value)
+                if not keep:
+                    break
+            if keep:
+                yield part
+
+    def scan(self, columns=None, where=()):
+        """Yield ``{column: array}`` per surviving part.
+
+        Partition keys are filled in as constants and string columns stay as codes. Unfiltered parts
+        return the memory maps themselves.
+        """
+        bound = self._bind(where)
+        for part in self.parts(where):
+            _, arrays = read_blocks(os.path.join(self.root, part["path"]))
+            mask = None
+            for column, op, value in bound:
+                if column in part["partition"]:
+                    continue
+                hit = OPS[op](arrays[column], value)
+                mask = hit if mask is None else mask & hit
+            if mask is not None and not mask.any():
+                continue
+            names = columns or list(self.partition_by) + list(arrays)
+            rows = part["rows"] if mask is None else int(mask.sum())
+            out = {}
+            for name in names:
+                if name in part["partition"]:
+                    out[name] = np.full(rows, part["partition"][name])
+                else:
+                    out[name] = arrays[name] if mask is None else arrays[name][mask]
+            yield out
+
+    def read(self, columns=None, where=()):
+        # All matching rows as a DataFrame, with string columns decoded to categoricals.
+        chunks = list(self.scan(columns, where))
+        if not chunks:
+            return pd.DataFrame(columns=columns or [])
+        frame = pd.DataFrame({name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]})
+        for name in frame.columns:
+            if name in self.dictionaries:
+                frame[name] = pd.Categorical.from_codes(frame[name].to_numpy(), categories=self.dictionaries[name])
+        return frame
+
+    def count(self, where=()):
+        return sum(len(chunk[self.partition_by[0]]) for chunk in self.scan(self.partition_by[:1], where))
+
+
+def top_yielders(dataset, cluster, crop, top=0.25, columns=("farm_id", "yield", "practices"), where=()):
+    # The top `top` share of farms by yield for one (cluster, crop), e.g. the rule-mining positives.
+    where = [("cluster", "==", cluster), ("crop", "==", crop), *where]
+    farms = dataset.read(list(dict.fromkeys(["yield", *columns])), where)
+    if farms.empty:
+        return farms
+    return farms[farms["yield"] >= np.quantile(farms["yield"], 1.0 - top)][list(columns)].reset_index(drop=True)
+
+
+def build_history_dataset(history, model, root=DATASET_DIR, **kwargs):
+    # Farm history labelled with the model's clusters, written partitioned by season/region/cluster.
+    from clustering import encode_profiles
+    return write_dataset(history.assign(cluster=model.predict(encode_profiles(history))), root, **kwargs)
+
+
+def _predicate(text):
+    for op in ("<=", ">=", "!=", "==", "<", ">", "="):
+        if op in text:
+            column, value = text.split(op, 1)
+            try:
+                value = float(value) if "." in value else int(value)
+            except ValueError:
+                pass
+            return column.strip(), "==" if op == "=" else op, value
+    raise argparse.ArgumentTypeError(f"cannot parse predicate {text!r}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query the partitioned farm dataset.")
+    parser.add_argument('command', choices=['build', 'query'])
+    parser.add_argument('--root', default=DATASET_DIR)
+    parser.add_argument('--history', help="CSV of historical farm records (default: AGRI_HISTORY_PATH or synthetic)")
+    parser.add_argument('--where', type=_predicate, action='append', default=[], help="e.g. cluster=2, yield>=3000")
+    parser.add_argument('--columns', help="comma-separated columns to return (default: all)")
+    parser.add_argument('--top', type=float, help="keep only this top share of rows by yield")
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        from artifacts import current_artifact
+        from history import load_history
+        try:
+            history = load_history(args.history)
+        except FileNotFoundError as error:
+            parser.error(str(error))
+        manifest = build_history_dataset(history, current_artifact().model, args.root)
+        print(f"Wrote {sum(p['rows'] for p in manifest['parts'])} rows in {len(manifest['parts'])} parts to {args.root}")
+        return 0
+
+    dataset = Dataset.open(args.root)
+    columns = args.columns.split(",") if args.columns else None
+    frame = dataset.read(columns if columns is None or args.top is None else list(dict.fromkeys(columns + ["yield"])),
+                         args.where)
+    if args.top is not None and len(frame):
+        frame = frame[frame["yield"] >= np.quantile(frame["yield"], 1.0 - args.top)]
+        frame = frame[columns] if columns else frame
+    frame.to_csv(sys.stdout, index=False)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
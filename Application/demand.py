@@ -0,0 +1,224 @@
+"""Regional resource demand: tonnes of fertilizer and cubic metres of water per region and month.
+
+Usage: python demand.py [--farms farms.csv] [--chunksize 200000] [--totals] [-o demand.csv]
+
+Every farm follows the resource plan of its cluster: the key actions the planner shows, one
+practice per resource type, scaled by its area and spread over the months of its crop's season.
+Since a plan depends only on the cluster, demand is the (region x cluster) table of hectares times
+a per-cluster (resource x month) plan: classifying a batch of farms is one bincount into that
+table, and re-classified or removed farms subtract their previous contribution first.
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from clustering import FEATURES
+from history import CROP_PEAK_MONTH, CROPS
+from rules import RESOURCE_ITEMS
+
+# Seasonal quantity per hectare, its unit, and how it is split over the months of the season
+# (month offsets from planting; -1 is the month before).
+RESOURCE_RATES = {
+    "Urea Fertilizer (High N)": {"unit": "t", "per_ha": 0.20, "schedule": {0: 0.5, 1: 0.5}},
+    "DAP Fertilizer (NP Mix)": {"unit": "t", "per_ha": 0.125, "schedule": {0: 1.0}},
+    "Bio-Compost Application": {"unit": "t", "per_ha": 5.0, "schedule": {-1: 1.0}},
+    "Potash (MOP) Top-Dressing": {"unit": "t", "per_ha": 0.06, "schedule": {2: 1.0}},
+    "Flooding Irrigation (Weekly)": {"unit": "m3", "per_ha": 10_000.0,
+                                     "schedule": {0: 0.25, 1: 0.25, 2: 0.25, 3: 0.25}},
+    "Sprinkler Irrigation": {"unit": "m3", "per_ha": 5_000.0, "schedule": {0: 0.25, 1: 0.25, 2: 0.25, 3: 0.25}},
+    "Drip Irrigation": {"unit": "m3", "per_ha": 3_500.0, "schedule": {0: 0.25, 1: 0.25, 2: 0.25, 3: 0.25}},
+    "Rainwater Harvesting": {"unit": "m3", "per_ha": 250.0, "schedule": {-1: 1.0}},
+}
+SEASON_MONTHS = 4  # planting to peak output
+DEFAULT_AREA = 1.0  # hectares, for farms that report none
+UNKNOWN_REGION = "unknown"
+
+
+def planting_month(crop):
+    # 0-based calendar month in which `crop` is planted; None for a crop without a known season.
+    if crop not in CROPS:
+        return None
+    return int(CROP_PEAK_MONTH[CROPS.index(crop)] - 1 - SEASON_MONTHS) % 12
+
+
+def cluster_plans(recommender, rates=RESOURCE_RATES):
+    """(clusters x resources x 12) demand per hectare, the resource names along axis 1, and the
+    clusters left without a plan because their crop has no known season.
+
+    A cluster is billed for its key actions, one practice per resource type, not for every practice
+    in its basket: a field is irrigated one way and gets one fertilizer.
+    """
+    resources = list(rates)
+    plans = np.zeros((recommender.model.n_clusters, len(resources), 12))
+    unplanned = []
+    for c in range(recommender.model.n_clusters):
+        start = planting_month(recommender.clusters[c]['crop'])
+        if start is None:
+            unplanned.append(c)
+            continue
+        for item in recommender.actions[c].values():
+            if item not in rates:
+                continue
+            rate = rates[item]
+            for offset, share in rate["schedule"].items():
+                plans[c, resources.index(item), (start + offset) % 12] += rate["per_ha"] * share
+    return plans, resources, unplanned
+
+
+class DemandAggregator:
+    """Region x resource x month demand over a set of farms, kept current as farms are (re)classified.
+
+    Per farm only its region, cluster and area are kept, in dense arrays behind an id -> row map as
+    in ingest.FarmProfiles, so a farm seen again replaces its earlier contribution.
+    """
+
+    def __init__(self, recommender, rates=RESOURCE_RATES, capacity=1024):
+        self.recommender = recommender
+        self.rates = rates
+        self.plans, self.resources, self.unplanned = cluster_plans(recommender, rates)
+        self.regions = []
+        self._region_index = {}
+        self.hectares = np.zeros((0, recommender.model.n_clusters))
+        self.index = {}
+        self.region = np.full(capacity, -1, np.int32)
+        self.cluster = np.full(capacity, -1, np.int32)
+        self.area = np.zeros(capacity)
+
+    def __len__(self):
+        return int(np.count_nonzero(self.cluster[:len(self.index)] >= 0))
+
+    def _reserve(self, size):
+        capacity = len(self.region)
+        if size <= capacity:
+            return
+        extra = max(size, 2 * capacity) - capacity
+        self.region = np.concatenate([self.region, np.full(extra, -1, np.int32)])
+        self.cluster = np.concatenate([self.cluster, np.full(extra, -1, np.int32)])
+        self.area = np.concatenate([self.area, np.zeros(extra)])
+
+    def _region_codes(self, regions):
+        inverse, distinct = pd.factorize(regions)
+        for name in distinct:
+            if name not in self._region_index:
+                self._region_index[name] = len(self.regions)
+                self.regions.append(name)
+        if len(self.regions) > len(self.hectares):
+            self.hectares = np.vstack([self.hectares,
+                                       np.zeros((len(self.regions) - len(self.hectares), self.hectares.shape[1]))])
+        return np.array([self._region_index[name] for name in distinct], np.int32)[inverse]
+
+    def _accumulate(self, rows, sign):
+        live = rows[self.cluster[rows] >= 0]
+        k = self.hectares.shape[1]
+        flat = self.region[live] * k + self.cluster[live]
+        counts = np.bincount(flat, weights=self.area[live], minlength=self.hectares.size)
+        self.hectares += sign * counts.reshape(self.hectares.shape)
+
+    def update(self, farms):
+        """Add or replace farms; returns the number of farms in the batch.
+
+        ``farms`` needs farm_id and either the profile fields to classify, or ``cluster`` with the
+        ``model_version`` it was scored with (as batch_score.py writes them); cluster IDs from another
+        model are only used if the profile fields are there to classify again. ``region`` and
+        ``area`` (hectares) are optional. Raises ValueError when the farms cannot be classified.
+        """
+        latest = farms.drop_duplicates('farm_id', keep='last')
+        version = self.recommender.version
+        if 'cluster' in latest and 'model_version' in latest and (latest['model_version'] == version).all():
+            cluster = latest['cluster'].to_numpy(np.int32)
+            if ((cluster < 0) | (cluster >= self.recommender.model.n_clusters)).any():
+                raise ValueError(f"cluster IDs outside the {self.recommender.model.n_clusters} clusters of model "
+                                 f"{version}")
+        elif all(feature in latest for feature in FEATURES):
+            cluster, _ = self.recommender.assign(latest)
+        else:
+            scored = sorted(set(latest['model_version'].astype(str))) if 'model_version' in latest else "no model"
+            raise ValueError(f"farms need the profile fields, or clusters scored with model {version} "
+                             f"(these were scored with {scored}); run batch_score.py again")
+        region = (latest['region'].fillna(UNKNOWN_REGION).astype(str).to_numpy(object) if 'region' in latest
+                  else np.full(len(latest), UNKNOWN_REGION, object))
+        area = (latest['area'].fillna(DEFAULT_AREA).to_numpy(np.float64) if 'area' in latest
+                else np.full(len(latest), DEFAULT_AREA))
+
+        rows = np.fromiter((self.index.setdefault(f, len(self.index)) for f in latest['farm_id']), np.int64,
+                           len(latest))
+        self._reserve(len(self.index))
+        self._accumulate(rows, -1.0)
+        self.region[rows] = self._region_codes(region)
+        self.cluster[rows] = cluster
+        self.area[rows] = area
+        self._accumulate(rows, 1.0)
+        return len(latest)
+
+    def remove(self, farm_ids):
+        rows = np.array([self.index[f] for f in farm_ids if f in self.index], np.int64)
+        if len(rows):
+            self._accumulate(rows, -1.0)
+            self.cluster[rows] = -1
+
+    def demand(self):
+        # (regions x resources x 12) array, ordered as self.regions and self.resources.
+        return np.einsum('rc,cim->rim', self.hectares, self.plans)
+
+    def table(self, totals=False):
+        """Long table: region, resource, type, unit, month (1-12) and quantity; non-zero rows only.
+
+        With ``totals=True`` the months are summed into one row per region and resource.
+        """
+        demand = self.demand()
+        if totals:
+            demand = demand.sum(axis=2, keepdims=True)
+        r, i, m = np.nonzero(demand > 1e-9)  # not float residue of removed farms
+        resources = np.asarray(self.resources, dtype=object)
+        frame = pd.DataFrame({
+            "region": np.asarray(self.regions, dtype=object)[r],
+            "resource": resources[i],
+            "type": [RESOURCE_ITEMS.get(item, {}).get("type", "other") for item in resources[i]],
+            "unit": [self.rates[item]["unit"] for item in resources[i]],
+            "month": m + 1,
+            "quantity": demand[r, i, m],
+        })
+        return frame.drop(columns="month") if totals else frame
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aggregate fertilizer and water demand per region and month.")
+    parser.add_argument('--farms', help="CSV/JSONL/Parquet of farm profiles with farm_id, region and area "
+                                        "(default: the model's farm history)")
+    parser.add_argument('--chunksize', type=int, default=200_000)
+    parser.add_argument('--totals', action='store_true', help="one row per region and resource for the season")
+    parser.add_argument('-o', '--output', help="CSV to write (default: stdout)")
+    args = parser.parse_args(argv)
+
+    from artifacts import current_artifact, training_history
+    from core import Recommender
+    artifact = current_artifact()
+    aggregator = DemandAggregator(Recommender(artifact))
+    start = time.perf_counter()
+    if args.farms:
+        from batch_score import iter_chunks
+        chunks = iter_chunks(args.farms, args.chunksize)
+    else:
+        history = training_history(artifact)
+        chunks = (history.iloc[i:i + args.chunksize] for i in range(0, len(history), args.chunksize))
+    try:
+        for chunk in chunks:
+            aggregator.update(chunk)
+    except ValueError as error:
+        print(f"Cannot aggregate {args.farms}: {error}", file=sys.stderr)
+        return 1
+    table = aggregator.table(totals=args.totals)
+    table.to_csv(args.output or sys.stdout, index=False, float_format="%.3f")
+    for c in aggregator.unplanned:
+        print(f"Left out {aggregator.hectares[:, c].sum():,.1f} ha in cluster {c}: no season known for crop "
+              f"{aggregator.recommender.clusters[c]['crop']!r}", file=sys.stderr)
+    print(f"Aggregated {len(aggregator)} farms in {len(aggregator.regions)} regions in "
+          f"{time.perf_counter() - start:.2f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
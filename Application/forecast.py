@@ -0,0 +1,113 @@
+import numpy as np
+
+from clustering import encode_profiles
+from history import load_history, load_yield_series
+from timeseries import YieldSeriesStore, month_index
+
+PERIODS = ('Monthly', 'Quarterly', 'Annual')
+SEASON = 12
+
+
+def _row_mean(Y):
+    # Mean of each row over its observed (non-NaN) values; NaN for rows with none.
+    valid = ~np.isnan(Y)
+    total = np.where(valid, Y, 0.0).sum(axis=1)
+    count = valid.sum(axis=1)
+    return np.divide(total, count, out=np.full(len(Y), np.nan), where=count > 0)
+
+
+class HoltWinters:
+    """Additive Holt-Winters state for many series at once; each step is vectorized over series.
+
+    Missing months (NaN) are skipped: the state carries its own forecast forward instead. A series
+    with no observed month in its first season has no level and forecasts NaN.
+    """
+
+    def __init__(self, Y_init, alpha=0.3, beta=0.05, gamma=0.2, season=SEASON):
+        Y_init = np.asarray(Y_init, dtype=np.float64)
+        if Y_init.shape[1] < 2 * season:
+            raise ValueError(f"need at least {2 * season} months of history, got {Y_init.shape[1]}")
+        self.alpha, self.beta, self.gamma, self.season = alpha, beta, gamma, season
+        self.level = _row_mean(Y_init[:, :season])
+        self.trend = np.nan_to_num((_row_mean(Y_init[:, season:2 * season]) - self.level) / season)
+        self.seasonal = np.nan_to_num(Y_init[:, :season] - self.level[:, None])
+        self.t = 0
+
+    def step(self, y):
+        # Observe one month for every series; returns the forecast that was made for it.
+        s = self.seasonal[:, self.t % self.season]
+        predicted = self.level + self.trend + s
+        y = np.where(np.isnan(y), predicted, y)
+        level = self.alpha * (y - s) + (1 - self.alpha) * (self.level + self.trend)
+        self.trend = self.beta * (level - self.level) + (1 - self.beta) * self.trend
+        self.seasonal[:, self.t % self.season] = self.gamma * (y - level) + (1 - self.gamma) * s
+        self.level = level
+        self.t += 1
+        return predicted
+
+    def predict(self, horizon=SEASON):
+        steps = np.arange(1, horizon + 1)
+        return (self.level[:, None] + self.trend[:, None] * steps
+                + self.seasonal[:, (self.t + steps - 1) % self.season])
+
+
+def holt_winters(Y, horizon=SEASON, **params):
+    # (fitted, forecast): one-step-ahead predictions for each observed month and the next `horizon` months.
+    Y = np.asarray(Y, dtype=np.float64)
+    model = HoltWinters(Y, **params)
+    fitted = np.column_stack([model.step(Y[:, t]) for t in range(Y.shape[1])])
+    return fitted, model.predict(horizon)
+
+
+def group_series(labels, Y, n_groups):
+    # Mean monthly series of each group (e.g. cluster), ignoring farms with missing months.
+    valid = ~np.isnan(Y)
+    onehot = np.zeros((n_groups, len(labels)))
+    onehot[labels, np.arange(len(labels))] = 1.0
+    totals = onehot @ np.where(valid, Y, 0.0)
+    counts = onehot @ valid
+    return totals / np.maximum(counts, 1)
+
+
+class YieldForecaster:
+    """Holt-Winters forecasts for a set of yield series, recorded in a YieldSeriesStore."""
+
+    LAST = {'Monthly': 12, 'Quarterly': 4, 'Annual': 5}
+
+    def __init__(self, series_ids, months, Y):
+        Y = np.asarray(Y, dtype=np.float64)
+        self.model = HoltWinters(Y)
+        fitted = np.column_stack([self.model.step(Y[:, t]) for t in range(Y.shape[1])])
+        self.store = YieldSeriesStore(series_ids, capacity=2 * Y.size)
+        rows, cols = np.indices(Y.shape)
+        self.store.append(rows.ravel(), month_index(months)[cols.ravel()], Y.ravel(), fitted.ravel())
+        self.next_month = int(month_index(months)[-1]) + 1
+        # The first season only initialises the model, so its "forecasts" are not genuine.
+        self.scored_from = int(month_index(months)[0]) + SEASON
+
+    def ingest_month(self, actual):
+        # New actuals for every series, for the month after the last one seen. Only the matching
+        # month, quarter and year buckets of the store are updated.
+        forecast = self.model.step(np.asarray(actual, dtype=np.float64))
+        rows = np.arange(len(forecast))
+        self.store.append(rows, np.full(len(rows), self.next_month), actual, forecast)
+        self.next_month += 1
+
+    def tracking_frame(self, series_id, period):
+        # Forecast vs actual for the most recent 12 months, 4 quarters or 5 years of one series.
+        return self.store.frame(series_id, period, self.LAST[period]).round().astype(int)
+
+
+def cluster_forecaster(model, history=None):
+    # Forecaster over each cluster's mean farm, fitted for every cluster in one pass.
+    history = load_history() if history is None else history
+    _, months, Y = load_yield_series(history)
+    labels = model.predict(encode_profiles(history))
+    return YieldForecaster(range(model.n_clusters), months, group_series(labels, Y, model.n_clusters))
+
+
+def farm_forecaster(model, history=None):
+    # Forecaster over every historical farm, plus each farm's cluster, for fleet-wide accuracy.
+    history = load_history() if history is None else history
+    farm_ids, months, Y = load_yield_series(history)
+    return YieldForecaster(farm_ids, months, Y), farm_ids, model.predict(encode_profiles(history))
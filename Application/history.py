@@ -0,0 +1,158 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from rules import RESOURCE_ITEMS
+
+# --- ZONE ARCHETYPES ---
+# Reference micro-climate profiles. They name the fitted clusters and seed the
+# synthetic history used when no historical farm file is available.
+ZONE_ARCHETYPES = [
+    {"name": "Tropical / High Nitrogen Zone", "N": 90, "P": 40, "K": 40, "ph": 6.2, "temp": 27.0,
+     "humidity": 82, "rainfall": 220, "irrigation": 0.9},
+    {"name": "Arid / Sandy Soil Zone", "N": 20, "P": 60, "K": 20, "ph": 7.4, "temp": 31.0,
+     "humidity": 35, "rainfall": 60, "irrigation": 0.2},
+    {"name": "Temperate / Loam Zone", "N": 70, "P": 50, "K": 50, "ph": 6.6, "temp": 22.0,
+     "humidity": 65, "rainfall": 120, "irrigation": 0.6},
+]
+
+CROPS = ["Rice", "Chickpea", "Maize"]
+
+# Share of each archetype's farms (rows) found in each region (columns), and the recorded seasons.
+REGIONS = ["North", "South", "East", "West"]
+REGION_MIX = np.array([
+    [0.15, 0.45, 0.30, 0.10],
+    [0.40, 0.05, 0.10, 0.45],
+    [0.45, 0.20, 0.25, 0.10],
+])
+SEASONS = list(range(2019, 2025))
+FARM_AREA_MEDIAN = 2.0  # hectares
+
+# Relative yield of each crop (columns, CROPS order) on each archetype (rows).
+CROP_SUITABILITY = np.array([
+    [1.00, 0.55, 0.75],
+    [0.45, 1.00, 0.60],
+    [0.70, 0.65, 1.00],
+])
+CROP_BASE_YIELD = np.array([4200.0, 1800.0, 5200.0])  # kg/ha
+
+# Yield uplift of a practice for each crop (CROPS order); practices not listed have no effect.
+PRACTICE_EFFECTS = {
+    "Urea Fertilizer (High N)": [0.25, -0.05, 0.08],
+    "DAP Fertilizer (NP Mix)": [0.05, 0.08, 0.22],
+    "Bio-Compost Application": [0.03, 0.28, 0.05],
+    "Potash (MOP) Top-Dressing": [0.04, 0.02, 0.10],
+    "Flooding Irrigation (Weekly)": [0.30, -0.15, -0.05],
+    "Sprinkler Irrigation": [0.0, 0.05, 0.18],
+    "Drip Irrigation": [0.02, 0.22, 0.06],
+}
+PRACTICE_RATE = 0.35  # chance that a farm uses any given practice
+
+# Spread of each feature around its archetype, and the input ranges of the profile form.
+FEATURE_NOISE = {"N": 12, "P": 10, "K": 10, "ph": 0.4, "temp": 2.5, "humidity": 8, "rainfall": 30}
+FEATURE_RANGES = {"N": (0, 140), "P": (5, 145), "K": (5, 205), "ph": (0.0, 14.0), "temp": (10.0, 50.0),
+                  "humidity": (10, 100), "rainfall": (0, 500), "irrigation": (0, 1)}
+
+HISTORY_PATH = os.environ.get("AGRI_HISTORY_PATH")
+YIELD_SERIES_PATH = os.environ.get("AGRI_YIELD_SERIES_PATH")
+
+# Month of peak output for each crop (CROPS order), for the synthetic monthly yield series.
+CROP_PEAK_MONTH = np.array([10, 3, 8])
+SERIES_START, SERIES_MONTHS = "2019-01-01", 72
+
+
+def parse_irrigation(col):
+    # Yes/No (or true/false) column -> 0/1 floats, value by value, so numbers mixed in with words keep their value.
+    if pd.api.types.is_numeric_dtype(col):
+        return col.astype(float)
+    number = pd.to_numeric(col, errors='coerce')
+    words = col.astype(str).str.strip().str.lower().isin(['yes', 'true']).astype(float)
+    return number.where(number.notna(), words).astype(float)
+
+
+def synthetic_history(n_farms=20000, seed=7):
+    rng = np.random.default_rng(seed)
+    zone = rng.integers(0, len(ZONE_ARCHETYPES), n_farms)
+
+    columns = {}
+    for feature, noise in FEATURE_NOISE.items():
+        centre = np.array([a[feature] for a in ZONE_ARCHETYPES], dtype=float)[zone]
+        low, high = FEATURE_RANGES[feature]
+        columns[feature] = np.clip(centre + rng.normal(0.0, noise, n_farms), low, high)
+    irrigation_rate = np.array([a["irrigation"] for a in ZONE_ARCHETYPES])[zone]
+    columns["irrigation"] = (rng.random(n_farms) < irrigation_rate).astype(float)
+
+    crop = rng.integers(0, len(CROPS), n_farms)
+    columns["crop"] = np.array(CROPS, dtype=object)[crop]
+    items = list(RESOURCE_ITEMS)
+    used = rng.random((n_farms, len(items))) < PRACTICE_RATE
+    effects = np.array([PRACTICE_EFFECTS.get(item, [0.0] * len(CROPS)) for item in items])
+    uplift = np.prod(1.0 + used * effects[:, crop].T, axis=1)
+    columns["yield"] = (CROP_BASE_YIELD[crop] * CROP_SUITABILITY[zone, crop] * uplift
+                        * rng.lognormal(0.0, 0.15, n_farms))
+
+    # Practice baskets as ';'-joined strings, built once per distinct combination.
+    codes = used @ (1 << np.arange(len(items)))
+    distinct, inverse = np.unique(codes, return_inverse=True)
+    baskets = np.array([";".join(item for j, item in enumerate(items) if code >> j & 1) for code in distinct],
+                       dtype=object)
+    columns["practices"] = baskets[inverse]
+
+    # Drawn last so the columns above do not depend on them.
+    cumulative = np.cumsum(REGION_MIX, axis=1)[zone]
+    region = (rng.random(n_farms)[:, None] > cumulative).sum(axis=1)
+    columns["region"] = np.array(REGIONS, dtype=object)[np.minimum(region, len(REGIONS) - 1)]
+    columns["season"] = rng.choice(SEASONS, n_farms)
+    columns["area"] = np.round(rng.lognormal(np.log(FARM_AREA_MEDIAN), 0.8, n_farms), 2)
+
+    frame = pd.DataFrame(columns)
+    frame.insert(0, "farm_id", np.arange(n_farms))
+    return frame
+
+
+def load_history(path=None, n_farms=20000, seed=7):
+    # Historical farm records: a CSV with the profile features plus crop, yield and practices columns.
+    path = history_source(path)
+    if path:
+        frame = pd.read_csv(path)
+        frame["irrigation"] = parse_irrigation(frame["irrigation"])
+        return frame
+    return synthetic_history(n_farms=n_farms, seed=seed)
+
+
+def history_source(path=None):
+    # What load_history(path) reads: the absolute path of the history file, or None for the synthetic history.
+    # The synthetic history stands in only when no file is set; a file that was set but is missing raises.
+    path = path or HISTORY_PATH
+    if not path:
+        return None
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"history file {path} does not exist")
+    return os.path.abspath(path)
+
+
+def synthetic_yield_series(history, start=SERIES_START, months=SERIES_MONTHS, seed=11):
+    # Monthly output (kg/ha) per farm: the farm's yield level, crop seasonality, a mild trend, a
+    # season-wide shock shared by all farms growing the same crop, and farm-level noise.
+    rng = np.random.default_rng(seed)
+    month_index = pd.date_range(start=start, periods=months, freq="MS")
+    crop = pd.Categorical(history["crop"], categories=CROPS).codes
+    level = history["yield"].to_numpy() / 12.0
+    phase = 2 * np.pi * (month_index.month.to_numpy()[None, :] - CROP_PEAK_MONTH[crop][:, None]) / 12.0
+    trend = 1.0 + 0.02 * np.arange(months)[None, :] / 12.0
+    shock = rng.lognormal(0.0, 0.08, (len(CROPS), months))[crop]
+    values = (level[:, None] * (1.0 + 0.35 * np.cos(phase)) * trend * shock
+              * rng.lognormal(0.0, 0.1, (len(history), months)))
+    return history["farm_id"].to_numpy(), month_index, values.astype(np.float32)
+
+
+def load_yield_series(history, path=None):
+    # (farm_ids, month starts, farms x months matrix). A CSV needs farm_id, month and yield columns.
+    path = path or YIELD_SERIES_PATH
+    if path and os.path.exists(path):
+        frame = pd.read_csv(path, parse_dates=["month"])
+        wide = frame.pivot_table(index="farm_id", columns="month", values="yield", aggfunc="sum")
+        wide = wide.reindex(history["farm_id"].to_numpy())
+        return wide.index.to_numpy(), pd.DatetimeIndex(wide.columns), wide.to_numpy(np.float32)
+    return synthetic_yield_series(history)
@@ -0,0 +1,272 @@
+"""Streaming ingestion of soil-lab and weather feeds with incremental model updates.
+
+Usage: python ingest.py spool/ [--follow] [--publish] [--publish-every 20]
+
+Feeds are CSV or JSON-lines files dropped into a spool directory (write them under another name and
+rename them in, so a half-written file is never picked up). Lab reports carry soil fields (N, P, K,
+ph), weather feeds carry climate fields (temp, humidity, rainfall); rows are keyed by farm_id and may
+also carry irrigation, crop, yield and practices. Every stage is a generator, so files are read,
+validated, merged and learned from one micro-batch at a time:
+
+    spool_files -> read_feeds -> normalize -> FarmProfiles.merge -> IncrementalUpdater.consume
+
+Processed files move to ``<spool>/done``.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from artifacts import MODEL_DIR, current_artifact, save_artifact, training_history
+from batch_score import iter_chunks
+from clustering import FEATURES, KMeansModel, centroid_averages, encode_profiles
+from history import FEATURE_RANGES
+from rules import RuleCounter, build_transactions
+
+FEED_SUFFIXES = ('.csv', '.jsonl', '.ndjson')
+# Lower-cased feed column -> profile field.
+FIELD_ALIASES = {'n': 'N', 'nitrogen': 'N', 'p': 'P', 'phosphorus': 'P', 'k': 'K', 'potassium': 'K',
+                 'soil_ph': 'ph', 'temperature': 'temp', 'temp_c': 'temp', 'hum': 'humidity', 'rh': 'humidity',
+                 'rain': 'rainfall', 'rain_mm': 'rainfall', 'irrigated': 'irrigation', 'farm': 'farm_id'}
+NUMERIC_FIELDS = FEATURES + ['yield']
+LABEL_FIELDS = ['crop', 'practices']
+
+
+# --- STAGES ---
+def spool_files(directory, follow=False, poll=2.0):
+    # Feed files in arrival order; each moves to done/ once the pipeline has pulled all of its rows.
+    done = os.path.join(directory, 'done')
+    os.makedirs(done, exist_ok=True)
+    while True:
+        paths = sorted((os.path.join(directory, name) for name in os.listdir(directory)
+                        if name.lower().endswith(FEED_SUFFIXES)), key=lambda p: (os.path.getmtime(p), p))
+        for path in paths:
+            yield path
+            os.replace(path, os.path.join(done, os.path.basename(path)))
+        if not follow:
+            return
+        if not paths:
+            time.sleep(poll)
+
+
+def read_feeds(paths, chunksize=50_000):
+    for path in paths:
+        yield from iter_chunks(path, chunksize)
+
+
+def _irrigation(col):
+    if pd.api.types.is_numeric_dtype(col):
+        return col.astype(np.float64)
+    flags = col.astype(str).str.strip().str.lower()
+    return flags.map({'yes': 1.0, 'true': 1.0, '1': 1.0, 'no': 0.0, 'false': 0.0, '0': 0.0}).where(col.notna())
+
+
+def normalize(chunks, stats=None):
+    """Validate and normalize raw feed chunks; yields clean frames with farm_id and the fields present.
+
+    Column names are matched case-insensitively through FIELD_ALIASES, ``temp_f`` is converted to
+    Celsius and irrigation Yes/No becomes 1/0. Every field a row carries must be numeric and inside
+    FEATURE_RANGES. Checks run column-wise over the whole chunk; a failing row is dropped and counted
+    in ``stats`` under its first failing reason.
+    """
+    stats = {} if stats is None else stats
+    for chunk in chunks:
+        chunk = chunk.rename(columns=lambda c: FIELD_ALIASES.get(str(c).strip().lower(), str(c).strip().lower()))
+        if 'temp_f' in chunk and 'temp' not in chunk:
+            chunk['temp'] = (pd.to_numeric(chunk.pop('temp_f'), errors='coerce') - 32) * 5 / 9
+
+        clean = pd.DataFrame({'farm_id': chunk['farm_id'] if 'farm_id' in chunk else pd.NA}, index=chunk.index)
+        rejected = np.zeros(len(chunk), bool)
+
+        def reject(mask, reason):
+            new = mask & ~rejected
+            if new.any():
+                stats[reason] = stats.get(reason, 0) + int(new.sum())
+            rejected[:] |= mask
+
+        reject(clean['farm_id'].isna().to_numpy(), 'missing farm_id')
+        fields = [f for f in NUMERIC_FIELDS if f in chunk]
+        for field in fields:
+            raw = chunk[field]
+            value = _irrigation(raw) if field == 'irrigation' else pd.to_numeric(raw, errors='coerce')
+            value = value.to_numpy(np.float64)
+            reject((raw.notna().to_numpy() & np.isnan(value)), f'{field}: not numeric')
+            low, high = FEATURE_RANGES.get(field, (0, np.inf))
+            with np.errstate(invalid='ignore'):
+                reject((value < low) | (value > high), f'{field}: out of range')
+            clean[field] = value
+        reject(~clean[fields].notna().any(axis=1).to_numpy() if fields else np.ones(len(chunk), bool),
+               'no profile fields')
+        for field in LABEL_FIELDS:
+            if field in chunk:
+                clean[field] = chunk[field]
+
+        stats['rows'] = stats.get('rows', 0) + len(chunk)
+        stats['accepted'] = stats.get('accepted', 0) + int((~rejected).sum())
+        if (~rejected).any():
+            yield clean[~rejected]
+
+
+class FarmProfiles:
+    """Latest known value of every field per farm, merged across lab and weather feeds.
+
+    Columns are dense arrays behind an id -> row map, as in YieldSeriesStore; a field left out of an
+    update keeps its previous value, so a lab report and a weather record complete each other. Per
+    farm it also remembers whether its profile has been complete before, and whether a yield has
+    arrived that was not yet reported as an outcome.
+    """
+
+    def __init__(self, capacity=1024):
+        self.index = {}
+        self.ids = np.empty(capacity, object)
+        self.numeric = np.full((capacity, len(NUMERIC_FIELDS)), np.nan)
+        self.labels = {field: np.full(capacity, None, object) for field in LABEL_FIELDS}
+        self.complete = np.zeros(capacity, bool)
+        self.pending_yield = np.zeros(capacity, bool)
+
+    def __len__(self):
+        return len(self.index)
+
+    def _reserve(self, size):
+        capacity = len(self.ids)
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity)
+        self.ids = np.concatenate([self.ids, np.empty(capacity - len(self.ids), object)])
+        self.numeric = np.vstack([self.numeric, np.full((capacity - len(self.numeric), len(NUMERIC_FIELDS)), np.nan)])
+        for field, column in self.labels.items():
+            self.labels[field] = np.concatenate([column, np.full(capacity - len(column), None, object)])
+        self.complete = np.concatenate([self.complete, np.zeros(capacity - len(self.complete), bool)])
+        self.pending_yield = np.concatenate([self.pending_yield, np.zeros(capacity - len(self.pending_yield), bool)])
+
+    def merge(self, batch):
+        """Fold a normalized batch in; returns the complete profiles of the farms it touched.
+
+        The result has farm_id, FEATURES, crop, yield, practices and two flags. ``first_complete`` is
+        true in the first batch in which a farm's profile is complete, so the model learns each farm
+        once. ``yield_reported`` is true once per yield that arrived since the farm's last outcome, as
+        soon as its profile and crop are known, even if the yield came in an earlier batch.
+        """
+        latest = batch.groupby('farm_id', sort=False).last()  # last non-null value per column
+        rows = np.fromiter((self.index.setdefault(f, len(self.index)) for f in latest.index), np.int64,
+                           len(latest))
+        self._reserve(len(self.index))
+        self.ids[rows] = latest.index.to_numpy(object)
+        for j, field in enumerate(NUMERIC_FIELDS):
+            if field in latest:
+                value = latest[field].to_numpy(np.float64)
+                have = ~np.isnan(value)
+                self.numeric[rows[have], j] = value[have]
+        for field, column in self.labels.items():
+            if field in latest:
+                have = latest[field].notna().to_numpy()
+                column[rows[have]] = latest[field].to_numpy(object)[have]
+
+        if 'yield' in latest:
+            self.pending_yield[rows[latest['yield'].notna().to_numpy()]] = True
+
+        rows = rows[~np.isnan(self.numeric[rows, :len(FEATURES)]).any(axis=1)]
+        first = ~self.complete[rows]
+        self.complete[rows] = True
+        reported = self.pending_yield[rows] & pd.notna(self.labels['crop'][rows])
+        self.pending_yield[rows[reported]] = False
+        profiles = pd.DataFrame(self.numeric[rows], columns=NUMERIC_FIELDS)
+        profiles.insert(0, 'farm_id', self.ids[rows])
+        for field, column in self.labels.items():
+            profiles[field] = column[rows]
+        profiles['first_complete'] = first
+        profiles['yield_reported'] = reported
+        return profiles
+
+
+class IncrementalUpdater:
+    """A working copy of the published cluster model and rule counts, updated per micro-batch.
+
+    Centroids move by mini-batch K-Means steps over farms whose profile just became complete; a
+    farm is learned once, not again with every later feed row. Per-centroid counts are capped at
+    ``memory`` so the learning rate never drops below 1/memory and recent feeds keep their weight.
+    Reported outcomes update a RuleCounter seeded from the farm history. Zone names and crops stay
+    those of the published artifact until the next full retrain.
+    """
+
+    def __init__(self, artifact, history=None, memory=50_000, batch_size=4096):
+        published = artifact.model
+        self.model = KMeansModel.restore(published.mean_, published.scale_, np.array(published.centers_),
+                                         published.counts_)
+        self.clusters = artifact.clusters
+        self.memory = memory
+        self.batch_size = batch_size
+        history = training_history(artifact) if history is None else history
+        self.history = artifact.history
+        self.rules = RuleCounter().add(build_transactions(history, published.predict(encode_profiles(history))))
+        self.profiles_seen = 0
+        self.outcomes_seen = 0
+
+    def consume(self, profiles):
+        new = profiles[profiles['first_complete']]
+        X = encode_profiles(new)
+        for i in range(0, len(X), self.batch_size):
+            if self.memory:
+                np.minimum(self.model.counts_, self.memory, out=self.model.counts_)
+            self.model.partial_fit(X[i:i + self.batch_size])
+        outcomes = profiles[profiles['yield_reported']]
+        if len(outcomes):
+            outcomes = outcomes.assign(practices=outcomes['practices'].fillna(''))
+            self.rules.add(build_transactions(outcomes, self.model.predict(encode_profiles(outcomes))))
+        self.profiles_seen += len(new)
+        self.outcomes_seen += len(outcomes)
+
+    def cluster_table(self):
+        centers = self.model.cluster_centers_
+        return {c: {**info, **centroid_averages(centers[c])} for c, info in self.clusters.items()}
+
+    def publish(self, model_dir=MODEL_DIR):
+        return save_artifact(self.model, self.cluster_table(), self.rules.rules(), model_dir=model_dir,
+                             history=self.history)
+
+
+def run(directory, follow=False, chunksize=50_000, publish=False, publish_every=0, model_dir=MODEL_DIR):
+    stats = {}
+    updater = IncrementalUpdater(current_artifact(model_dir))
+    farms = FarmProfiles()
+    batches = normalize(read_feeds(spool_files(directory, follow), chunksize), stats)
+    for n, batch in enumerate(batches, 1):
+        updater.consume(farms.merge(batch))
+        if publish and publish_every and n % publish_every == 0:
+            print(updater.publish(model_dir))
+    if publish and updater.profiles_seen:
+        print(updater.publish(model_dir))
+    return updater, farms, stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest lab and weather feeds and update the models incrementally.")
+    parser.add_argument('spool', help="directory that feed files (.csv, .jsonl) are dropped into")
+    parser.add_argument('--follow', action='store_true', help="keep watching the spool for new files")
+    parser.add_argument('--chunksize', type=int, default=50_000, help="rows per micro-batch")
+    parser.add_argument('--publish', action='store_true', help="publish the updated models as a new artifact")
+    parser.add_argument('--publish-every', type=int, default=0, help="also publish every N micro-batches")
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    try:
+        updater, farms, stats = run(args.spool, args.follow, args.chunksize, args.publish, args.publish_every,
+                                    args.model_dir)
+    except KeyboardInterrupt:
+        return 0
+    elapsed = time.perf_counter() - start
+    print(f"Read {stats.get('rows', 0)} rows ({stats.get('accepted', 0)} accepted) for {len(farms)} farms in "
+          f"{elapsed:.2f}s; {updater.profiles_seen} farms learned, {updater.outcomes_seen} outcomes",
+          file=sys.stderr)
+    for reason, count in sorted(stats.items()):
+        if reason not in ('rows', 'accepted'):
+            print(f"  rejected {count}: {reason}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,233 @@
+"""Quantized lookup table: recommendations by array index for most inputs, exact assignment for the rest.
+
+Usage: python lut.py [--model-dir models] [--cells 16777216]
+
+The bounded input space (FEATURE_RANGES) is cut into a grid: two bins for irrigation, and for the
+other features as many as the cell budget allows (see ``grid_spec``). Every cell stores two bytes,
+evaluated once at its centre: the cluster, and the match score quantized to 0-255. The cluster
+byte's high bit marks cells that a decision boundary passes through. This is checked exactly: the
+difference of two squared distances is linear in the input, so its minimum over a cell is known.
+Lookups in unmarked cells return the exact cluster without any distance computation. Lookups in
+marked cells, and out-of-range inputs, fall back to the exact assignment. At the default budget
+that is roughly a third of the cells (``near_boundary`` in the header, printed by the CLI).
+
+A table pass is not free: on 500k synthetic farms with the default 3-cluster model it takes 0.14s,
+against 0.16s for the exact assignment, so it only pays off when few rows fall back. Above
+MAX_NEAR_BOUNDARY marked cells ``assign`` skips the table and assigns every row exactly from the
+centroids in the file (0.16s instead of 0.21s with the table; exact match scores too). The table
+then only serves ``lookup`` and ``exact_fallback=False`` callers.
+
+The match score of a table hit is that of the cell centre, not of the input. On synthetic farms at
+the default budget it is off from the exact score by 0.02 at the median and 0.15 at the 99th
+percentile, and by up to about 0.35 in the worst case. Fallback rows get exact scores.
+
+The table is a block file next to its artifact (``model-<version>.lut.agb``) and is memory-mapped,
+so processes share one copy. It is rebuilt when the artifact version (which embeds the artifact
+checksum), the cell budget or LUT_FORMAT changes. The file also holds the model's scaler and
+centroids for the fallback, and the header holds zone, crop and basket per cluster, so a field
+device needs nothing but this file.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from blockfile import read_blocks, write_blocks
+from clustering import FEATURES, KMeansModel, encode_profiles
+from core import Recommender, assign
+from history import FEATURE_RANGES
+
+LUT_CELLS = int(os.environ.get("AGRI_LUT_CELLS", 1 << 24))
+LUT_FORMAT = 2  # bump when the file layout changes, so existing tables are rebuilt
+NEAR_BOUNDARY = 0x80
+MAX_NEAR_BOUNDARY = 0.1  # share of marked cells above which a table pass costs more than it saves
+BINARY = ('irrigation',)
+
+
+def grid_spec(model, cells=LUT_CELLS):
+    """(low, width, bins) per feature that fit in ``cells``.
+
+    Bins are sized so every feature contributes the same worst-case error to the distance margins.
+    The bin width in standardized units is inversely proportional to the largest gap between
+    centroids on that feature, so features that barely separate the clusters get few bins.
+    """
+    low = np.array([FEATURE_RANGES[f][0] for f in FEATURES], dtype=np.float64)
+    span = np.array([FEATURE_RANGES[f][1] for f in FEATURES], dtype=np.float64) - low
+    binary = np.isin(FEATURES, BINARY)
+    centers = model.centers_
+    gap = (centers.max(axis=0) - centers.min(axis=0)) if len(centers) > 1 else np.ones(len(FEATURES))
+    need = span / model.scale_ * gap
+
+    def bins_for(w):
+        return np.where(binary, 2, np.maximum(np.ceil(need / w), 1)).astype(np.int64)
+
+    lo, hi = 1e-9, float(need.max()) + 1.0
+    for _ in range(100):
+        mid = (lo + hi) / 2
+        lo, hi = (mid, hi) if np.prod(bins_for(mid).astype(float)) > cells else (lo, mid)
+    bins = bins_for(hi)
+    width = np.where(binary, 1.0, span / bins)
+    return low, width, bins
+
+
+def build_table(model, low, width, bins):
+    """(cells, 2) uint8 table of (cluster | NEAR_BOUNDARY, match * 255), in C order over FEATURES.
+
+    Squared distance is a sum of per-feature terms, so the trailing features' terms are summed once
+    into a (cells / bins[0], k) block and each slice of the first feature adds its own column.
+    """
+    centers, k = model.centers_, model.n_clusters
+    binary = np.isin(FEATURES, BINARY)
+    terms = []
+    for j in range(len(FEATURES)):
+        values = np.arange(bins[j]) if binary[j] else low[j] + (np.arange(bins[j]) + 0.5) * width[j]
+        scaled = (values - model.mean_[j]) / model.scale_[j]
+        terms.append((scaled[:, None] - centers[None, :, j]) ** 2)
+    # d_j^2 - d_c^2 is linear in the input, so its minimum over a cell is the centre value minus
+    # sum_f half-width_f * |2 (c_c - c_j)_f|; a cell is certain when that stays positive for every j.
+    half = np.where(binary, 0.0, width / model.scale_ / 2)
+    margin = 2 * np.abs(centers[:, None, :] - centers[None, :, :]) @ half
+    np.fill_diagonal(margin, -np.inf)
+
+    tail = np.zeros((1, k))
+    for term in terms[1:]:
+        tail = (tail[:, None, :] + term[None, :, :]).reshape(-1, k)
+    table = np.empty((int(np.prod(bins)), 2), np.uint8)
+    for i in range(bins[0]):
+        sq = tail + terms[0][i]
+        cluster = np.argmin(sq, axis=1)
+        out = table[i * len(tail):(i + 1) * len(tail)]
+        if k < 2:
+            out[:, 0], out[:, 1] = cluster, 255
+            continue
+        own = sq[np.arange(len(sq)), cluster]
+        near = np.any(sq - own[:, None] <= margin[cluster], axis=1)
+        nearest = np.sqrt(np.maximum(np.partition(sq, 1, axis=1)[:, :2], 0.0))
+        out[:, 0] = cluster | np.where(near, NEAR_BOUNDARY, 0)
+        out[:, 1] = np.round(255 * (1.0 - nearest[:, 0] / np.maximum(nearest[:, 1], 1e-12)))
+    return table
+
+
+class LookupTable:
+    """A memory-mapped lookup table, with the scaler and centroids its exact fallback needs."""
+
+    def __init__(self, path, meta, arrays):
+        self.path = path
+        self.meta = meta
+        self.version = meta["version"]
+        self.table = arrays["table"]
+        self.low, self.width, self.bins = np.array(arrays["low"]), np.array(arrays["width"]), np.array(arrays["bins"])
+        self.strides = np.cumprod(np.append(1, self.bins[:0:-1]))[::-1].astype(np.float64)
+        self.inv_width = 1.0 / self.width
+        self.high = self.low + self.width * np.where(np.isin(FEATURES, BINARY), 1, self.bins)
+        self.binary = np.flatnonzero(np.isin(FEATURES, BINARY))
+        self.model = KMeansModel.restore(arrays["mean"], arrays["scale"], arrays["centers"], arrays["counts"])
+        self.use_table = meta["near_boundary"] <= MAX_NEAR_BOUNDARY
+
+    @classmethod
+    def open(cls, path):
+        meta, arrays = read_blocks(path)
+        return cls(path, meta, arrays)
+
+    def __len__(self):
+        return len(self.table)
+
+    def lookup(self, X):
+        """(cluster, match, exact) for encoded profiles; ``exact`` marks rows the table cannot answer.
+
+        Those are near-boundary cells and inputs outside the grid. Their cluster and match are the
+        cell's values (or -1 / 0 outside the grid).
+        """
+        X = np.asarray(X, dtype=np.float64)
+        q = X - self.low
+        q *= self.inv_width
+        np.floor(q, out=q)
+        inside = np.all((q >= 0) & (X <= self.high), axis=1)
+        binary = X[:, self.binary]
+        inside &= np.all((binary == 0) | (binary == 1), axis=1)
+        np.clip(q, 0, self.bins - 1, out=q)
+        cells = self.table[(q @ self.strides).astype(np.int64)]
+        cluster = (cells[:, 0] & (NEAR_BOUNDARY - 1)).astype(np.int64)
+        cluster[~inside] = -1
+        match = np.where(inside, cells[:, 1] / 255.0, 0.0)
+        return cluster, match, ~inside | (cells[:, 0] & NEAR_BOUNDARY > 0)
+
+    def assign(self, X, exact_fallback=True):
+        # (cluster, match) for encoded profiles; rows the table cannot answer use the stored centroids.
+        if exact_fallback and not self.use_table:
+            return assign(self.model, np.asarray(X, dtype=np.float64))
+        cluster, match, exact = self.lookup(X)
+        if exact_fallback and exact.any():
+            cluster[exact], match[exact] = assign(self.model, np.asarray(X, dtype=np.float64)[exact])
+        return cluster, match
+
+
+def lut_path(artifact_path):
+    return os.path.splitext(artifact_path)[0] + ".lut.agb"
+
+
+def write_lookup_table(artifact, path=None, cells=LUT_CELLS, basket_size=4):
+    recommender = Recommender(artifact, basket_size)
+    low, width, bins = grid_spec(artifact.model, cells)
+    table = build_table(artifact.model, low, width, bins)
+    plans = {c: {"zone": info["name"], "crop": info["crop"], "basket": recommender.items[c]}
+             for c, info in recommender.clusters.items()}
+    meta = {"version": artifact.version, "format": LUT_FORMAT, "cells": cells, "features": FEATURES,
+            "plans": plans, "near_boundary": float(np.mean(table[:, 0] & NEAR_BOUNDARY > 0))}
+    path = path or lut_path(artifact.path)
+    model = artifact.model
+    write_blocks(path, {"table": table, "low": low, "width": width, "bins": bins, "mean": model.mean_,
+                        "scale": model.scale_, "centers": model.centers_, "counts": model.counts_}, meta=meta)
+    return path
+
+
+def load_lookup_table(artifact, cells=LUT_CELLS):
+    # Built on first use for each artifact version, then memory-mapped by every later process.
+    path = lut_path(artifact.path)
+    if os.path.exists(path):
+        meta, arrays = read_blocks(path)
+        if (meta["version"], meta.get("format"), meta.get("cells")) == (artifact.version, LUT_FORMAT, cells):
+            return LookupTable(path, meta, arrays)
+    write_lookup_table(artifact, path, cells)
+    return LookupTable.open(path)
+
+
+class LookupRecommender(Recommender):
+    """Recommender that assigns clusters from a LookupTable.
+
+    Rows the table cannot answer are assigned exactly, unless ``exact_fallback`` is off. In that
+    case they get the cell's cluster, and -1 outside the grid.
+    """
+
+    def __init__(self, artifact, table, basket_size=4, exact_fallback=True):
+        super().__init__(artifact, basket_size)
+        if table.version != artifact.version:
+            raise ValueError(f"lookup table {table.version} does not match artifact {artifact.version}")
+        self.table = table
+        self.exact_fallback = exact_fallback
+
+    def assign(self, profiles):
+        return self.table.assign(encode_profiles(profiles), self.exact_fallback)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the quantized lookup table for the current model.")
+    parser.add_argument('--model-dir', help="model directory (default: models/)")
+    parser.add_argument('--cells', type=int, default=LUT_CELLS, help="grid cells (2 bytes each)")
+    args = parser.parse_args(argv)
+
+    from artifacts import MODEL_DIR, current_artifact
+    artifact = current_artifact(args.model_dir or MODEL_DIR)
+    start = time.perf_counter()
+    table = load_lookup_table(artifact, args.cells)
+    print(f"{table.path}: {len(table):,} cells, bins {table.bins.tolist()}, "
+          f"{table.meta['near_boundary']:.1%} near a boundary ({time.perf_counter() - start:.1f}s)", file=sys.stderr)
+    if not table.use_table:
+        print(f"More than {MAX_NEAR_BOUNDARY:.0%} of cells fall back, so assignment skips the table.", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,34 @@
+"""Train the cluster model and rule table, and publish them as a new artifact.
+
+Usage: python models.py [--history farms.csv]
+"""
+import argparse
+
+from artifacts import MODEL_DIR, save_artifact
+from clustering import encode_profiles, load_cluster_model
+from history import history_source, load_history
+from rules import build_transactions, mine_rules
+
+
+def train_models(history=None):
+    # Cluster model, cluster table and mined rule table from historical farm records.
+    history = load_history() if history is None else history
+    model, clusters = load_cluster_model(history)
+    labels = model.predict(encode_profiles(history))
+    return model, clusters, mine_rules(build_transactions(history, labels))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train models and publish a new artifact version.")
+    parser.add_argument('--history', help="CSV of historical farm records (default: AGRI_HISTORY_PATH or synthetic)")
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    args = parser.parse_args(argv)
+    try:
+        source = history_source(args.history)
+    except FileNotFoundError as error:
+        parser.error(str(error))
+    print(save_artifact(*train_models(load_history(source)), model_dir=args.model_dir, history={"path": source}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""Approximate nearest-farm index ("farms like mine") over historical profiles.
+
+An inverted-file (IVF) index: a coarse k-means quantizer splits the farms into ~sqrt(n) lists,
+rows are stored contiguously per list, and a query scans only the few lists whose centroids are
+closest to it. Distances use the cluster model's standardization, so "similar" means the same thing
+as it does for the zone assignment. The index is a block file next to its model artifact and is
+opened memory-mapped.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from blockfile import read_blocks, write_blocks
+from clustering import FEATURES, encode_profiles
+
+
+def _nearest(X, centroids, chunk=16384):
+    # Closest centroid per row; ||x||^2 is constant per row, so it is left out of the argmin.
+    neg2_ct = -2.0 * centroids.T
+    cc = np.einsum('ij,ij->i', centroids, centroids)
+    return np.concatenate([np.argmin(X[i:i + chunk] @ neg2_ct + cc, axis=1)
+                           for i in range(0, len(X), chunk)]) if len(X) else np.zeros(0, np.int64)
+
+
+def train_quantizer(X, n_lists, rng, n_iter=8):
+    # A few Lloyd passes on a sample of about 64 rows per list; plenty for routing queries.
+    sample = X[rng.choice(len(X), min(len(X), 64 * n_lists), replace=False)]
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+    for _ in range(n_iter):
+        labels = _nearest(sample, centroids)
+        counts = np.bincount(labels, minlength=n_lists)
+        sums = np.column_stack([np.bincount(labels, weights=sample[:, j], minlength=n_lists)
+                                for j in range(X.shape[1])])
+        hit = counts > 0
+        centroids[hit] = sums[hit] / counts[hit, None]
+    return centroids
+
+
+def index_arrays(model, history, n_lists=None, seed=0):
+    # Build the IVF layout for `history` as (columns, meta): ~sqrt(n) lists, rows grouped by list.
+    X = model._scale(encode_profiles(history)).astype(np.float32)
+    n_lists = n_lists or max(1, int(np.sqrt(len(X))))
+    centroids = train_quantizer(X, n_lists, np.random.default_rng(seed))
+
+    lists = _nearest(X, centroids)
+    order = np.argsort(lists, kind='stable')
+    bounds = np.searchsorted(lists[order], np.arange(n_lists + 1))
+    crop_codes, crops = pd.factorize(history['crop'].astype(str), sort=True)
+    return {
+        "centroids": centroids.astype(np.float32),
+        "list_start": bounds.astype(np.int64),
+        "X": X[order],
+        "farm_id": history['farm_id'].to_numpy(np.int64)[order],
+        "crop": crop_codes.astype(np.int16)[order],
+        "yield": history['yield'].to_numpy(np.float32)[order],
+        "cluster": model.predict(encode_profiles(history)).astype(np.int16)[order],
+    }, {"crops": list(crops), "features": FEATURES}
+
+
+class FarmIndex:
+
+    def __init__(self, columns, meta, model):
+        self.columns = columns
+        self.crops = meta["crops"]
+        self.history = meta.get("history")
+        self.model = model
+        self._cc = np.einsum('ij,ij->i', columns["centroids"], columns["centroids"])
+
+    @classmethod
+    def build(cls, model, history, **kwargs):
+        return cls(*index_arrays(model, history, **kwargs), model)
+
+    @classmethod
+    def open(cls, path, model):
+        meta, columns = read_blocks(path)
+        return cls(columns, meta, model)
+
+    def __len__(self):
+        return len(self.columns["X"])
+
+    def _candidates(self, q, k, n_probe):
+        # Rows of the closest lists, probing beyond `n_probe` lists until there are at least k rows.
+        centroids, start = self.columns["centroids"], self.columns["list_start"]
+        order = np.argsort(self._cc - 2.0 * (centroids @ q))
+        sizes = (start[order + 1] - start[order])
+        n = max(n_probe, int(np.searchsorted(np.cumsum(sizes), k)) + 1)
+        return np.concatenate([np.arange(start[l], start[l + 1]) for l in order[:n]])
+
+    def search(self, profile, k=50, n_probe=8):
+        """The ``k`` (approximately) nearest historical farms to one profile, closest first.
+
+        Returns a DataFrame with farm_id, crop, yield, cluster, distance (standardized units) and the
+        raw profile features of each neighbour.
+        """
+        q = self.model._scale(encode_profiles(profile))[0].astype(np.float32)
+        rows = self._candidates(q, k, n_probe)
+        X = self.columns["X"][rows]
+        dist = np.einsum('ij,ij->i', X, X) - 2.0 * (X @ q) + q @ q
+        top = np.argpartition(dist, min(k, len(rows)) - 1)[:k] if len(rows) > k else np.arange(len(rows))
+        top = top[np.argsort(dist[top])]
+        rows = rows[top]
+        raw = X[top] * self.model.scale_ + self.model.mean_
+        raw[:, FEATURES.index('irrigation')] = np.round(raw[:, FEATURES.index('irrigation')])
+        frame = pd.DataFrame({
+            "farm_id": self.columns["farm_id"][rows],
+            "crop": pd.Categorical.from_codes(self.columns["crop"][rows], categories=self.crops),
+            "yield": self.columns["yield"][rows],
+            "cluster": self.columns["cluster"][rows],
+            "distance": np.sqrt(np.maximum(dist[top], 0)),
+        })
+        for j, feature in enumerate(FEATURES):
+            frame[feature] = raw[:, j]
+        return frame
+
+
+def match_score(neighbours, cluster):
+    # Share of the nearest historical farms that the model places in the same cluster.
+    return float(np.mean(neighbours['cluster'].to_numpy() == cluster)) if len(neighbours) else 0.0
+
+
+def index_path(artifact_path):
+    return os.path.splitext(artifact_path)[0] + ".farms.agb"
+
+
+def load_farm_index(artifact, history=None):
+    # The index of an artifact is built once, on first use, and reused by every later process. An
+    # index built from other farms than the artifact's training history is rebuilt.
+    from artifacts import training_history, training_source
+    path = index_path(artifact.path)
+    source = training_source(artifact)
+    if os.path.exists(path):
+        index = FarmIndex.open(path, artifact.model)
+        if index.history == source:
+            return index
+    history = training_history(artifact) if history is None else history
+    columns, meta = index_arrays(artifact.model, history)
+    write_blocks(path, columns, meta=dict(meta, version=artifact.version, history=source))
+    return FarmIndex.open(path, artifact.model)
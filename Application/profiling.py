@@ -0,0 +1,133 @@
+"""Lightweight timing instrumentation for reruns, views and helpers.
+
+``timed(name)`` works as a context manager or decorator. Every measurement feeds process-wide
+histograms (exportable as JSON or Prometheus text) and, while a rerun is active, that rerun's
+timeline. A profiler (cProfile, or pyinstrument when installed) can be attached to a rerun via
+``?profile=cprofile`` / ``?profile=pyinstrument`` or the AGRI_PROFILE environment variable.
+"""
+import contextlib
+import contextvars
+import cProfile
+import io
+import json
+import os
+import pstats
+import tempfile
+import threading
+import time
+
+PROFILE_MODE = os.environ.get("AGRI_PROFILE", "")
+METRICS_FILE = os.environ.get("AGRI_METRICS_FILE")  # e.g. for the node-exporter textfile collector
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_stats = {}
+_timeline = contextvars.ContextVar("agri_timeline", default=None)
+
+
+def record(name, seconds):
+    with _lock:
+        stat = _stats.get(name)
+        if stat is None:
+            stat = _stats[name] = {"count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * len(BUCKETS)}
+        stat["count"] += 1
+        stat["sum"] += seconds
+        stat["max"] = max(stat["max"], seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                stat["buckets"][i] += 1
+    timeline = _timeline.get()
+    if timeline is not None:
+        timeline["events"].append({"name": name, "start": round(time.perf_counter() - seconds - timeline["t0"], 6),
+                                   "seconds": round(seconds, 6)})
+
+
+class timed(contextlib.ContextDecorator):
+
+    def __init__(self, name):
+        self.name = name
+
+    def _recreate_cm(self):
+        # As a decorator, each call gets its own instance: reruns on other script threads keep their start.
+        return timed(self.name)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def begin_rerun(session_id=None, profile=None):
+    # Start the timeline (and optional profiler) of one script run in the current thread.
+    mode = profile or PROFILE_MODE
+    rerun = {"session": session_id, "started": time.time(), "t0": time.perf_counter(), "events": [],
+             "profile_mode": mode or None, "profiler": None}
+    if mode == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            mode = rerun["profile_mode"] = "cprofile"
+        else:
+            rerun["profiler"] = Profiler()
+            rerun["profiler"].start()
+    if mode in ("1", "cprofile"):
+        rerun["profiler"] = cProfile.Profile()
+        try:
+            rerun["profiler"].enable()
+        except ValueError:  # another profiler is already active in this process
+            rerun["profiler"] = None
+    _timeline.set(rerun)
+    return rerun
+
+
+def end_rerun(rerun, top=30):
+    # Close a rerun: total time, profiler report, and the metrics file if one is configured.
+    rerun["seconds"] = round(time.perf_counter() - rerun["t0"], 6)
+    _timeline.set(None)
+    record("rerun", rerun["seconds"])
+    profiler = rerun.pop("profiler")
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(top)
+        rerun["profile"] = out.getvalue()
+    elif profiler is not None:
+        profiler.stop()
+        rerun["profile"] = profiler.output_text()
+    if METRICS_FILE:
+        write_metrics(METRICS_FILE)
+    return rerun
+
+
+def snapshot():
+    with _lock:
+        return {name: dict(stat, buckets=list(stat["buckets"])) for name, stat in _stats.items()}
+
+
+def export_json(timelines=()):
+    reruns = [{k: v for k, v in rerun.items() if k not in ("t0", "profiler")} for rerun in timelines]
+    return json.dumps({"sections": snapshot(), "reruns": reruns}, indent=2)
+
+
+def export_prometheus():
+    lines = ["# HELP agri_section_seconds Time spent per instrumented section.",
+             "# TYPE agri_section_seconds histogram"]
+    for name, stat in sorted(snapshot().items()):
+        label = name.replace("\\", "\\\\").replace('"', '\\"')
+        for bound, count in zip(BUCKETS, stat["buckets"]):
+            lines.append(f'agri_section_seconds_bucket{{section="{label}",le="{bound}"}} {count}')
+        lines.append(f'agri_section_seconds_bucket{{section="{label}",le="+Inf"}} {stat["count"]}')
+        lines.append(f'agri_section_seconds_sum{{section="{label}"}} {stat["sum"]:.6f}')
+        lines.append(f'agri_section_seconds_count{{section="{label}"}} {stat["count"]}')
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as fh:
+        fh.write(export_prometheus())
+    os.replace(tmp_path, path)
@@ -0,0 +1,323 @@
+"""Bulk static reports: one printable page per farm with its zone, resource plan and tracking charts.
+
+Usage: python reports.py profiles.csv -o reports/ [--format html|png|pdf] [--processes 8] [--force]
+
+The input has the profile fields plus an optional farm_id. All profiles are assigned in one
+vectorized pass, and the report content for each farm is hashed together with the model version
+and REPORT_VERSION. Farms whose hash matches ``reports.json`` in the output directory are skipped,
+so a rerun only renders new or changed reports.
+
+The rest is rendered across a process pool. Workers receive the per-cluster plans and tracking data
+once, at start-up. Figures come from charts.py, so they share its layout templates; each worker
+builds a cluster's tracking charts once and reuses them for every farm in that cluster. HTML pages load one shared
+``plotly.min.js`` from the output directory. PNG and PDF pages are a single composite figure
+exported with kaleido, which is optional and only needed for those formats.
+"""
+import argparse
+import hashlib
+import html
+import json
+import os
+import re
+import string
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from clustering import FEATURES, encode_profiles
+from core import assign
+
+REPORT_VERSION = 2  # bump when the page or its figures change, so every report is rendered again
+MANIFEST = "reports.json"
+PLOTLY_JS = "plotly.min.js"
+FORMATS = ("html", "png", "pdf")
+TRACKING = (("Monthly", "line"), ("Annual", "bar"))
+PAGE_SIZE = (850, 1100)  # pixels, for PNG / PDF pages
+
+PAGE = string.Template("""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Farm $farm - Agri-Forecast plan</title>
+<script src="$plotly_js"></script>
+<style>
+body { font-family: sans-serif; color: #333333; max-width: 960px; margin: 24px auto; }
+h1, h2, h3 { color: #2E5A31; }
+.card { border: 1px solid #E0E0E0; border-radius: 10px; padding: 16px; margin-bottom: 16px; }
+.metrics { display: flex; gap: 32px; }
+.metrics div b { display: block; font-size: 1.3rem; }
+.rule { background: #000080; color: #FFFFFF; border-radius: 10px; padding: 10px 15px; margin-bottom: 8px; }
+.rule p { margin: 4px 0 0; font-size: 0.9rem; }
+.summary { background: #E8F5E9; border-radius: 10px; padding: 10px 20px; }
+@media print { .card { break-inside: avoid; } }
+</style></head>
+<body>
+<h1>Agri-Forecast plan for farm $farm</h1>
+<div class="card">
+<h2>Cluster identification</h2>
+<div class="metrics"><div>Cluster<b>$cluster</b></div><div>Zone type<b>$zone</b></div>
+<div>Recommended crop<b>$crop</b></div><div>Match score<b>$match</b></div></div>
+$radar
+</div>
+<div class="card">
+<h2>Proactive resource plan for $crop</h2>
+$rules
+<div class="summary"><h3>Key actions</h3><ul>$actions</ul></div>
+</div>
+<div class="card">
+<h2>Forecast &amp; yield tracking</h2>
+$tracking
+</div>
+<p><small>Model $version</small></p>
+</body></html>
+""")
+
+_worker = {}  # per-process: plans, tracking data, output settings and rendered per-cluster fragments
+
+
+def safe_name(farm_id):
+    # File stem of a farm's report. Ids with other characters are sanitized and get a hash of the raw
+    # id after "~", which a kept id cannot contain, so two farms never share a file.
+    raw = str(farm_id)
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", raw)
+    return name if name == raw else f"{name}~{hashlib.sha256(raw.encode()).hexdigest()[:16]}"
+
+
+# --- CONTENT ---
+def cluster_plans(recommender, forecaster):
+    # Everything a report needs that depends only on the cluster, as plain picklable values.
+    plans = {}
+    for c, info in recommender.clusters.items():
+        plans[c] = {
+            "zone": info["name"], "crop": info["crop"],
+            "cluster_r": (info['avg_n'], info['avg_p'], info['avg_k'], info['avg_ph'] * 10, info['avg_temp'] * 2),
+            "rules": [{k: rule[k] for k in ("item", "desc", "conf", "lift")} for rule in recommender.baskets[c]],
+            "actions": recommender.actions[c],
+            "tracking": {period: forecaster.tracking_frame(c, period) for period, _ in TRACKING},
+        }
+    return plans
+
+
+def plan_digest(plan):
+    # Hash of a cluster's report content, so a changed basket or new tracking data re-renders its farms.
+    content = {**plan, "tracking": {period: frame.to_json() for period, frame in plan["tracking"].items()}}
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+def content_key(version, fmt, profile, cluster, match, digest):
+    # Rounded, so re-exported input files whose floats differ only in the last bits count as unchanged.
+    profile = [round(value, 6) for value in profile]
+    payload = json.dumps([REPORT_VERSION, version, fmt, profile, cluster, round(match, 4), digest])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+# --- RENDERING (worker side) ---
+def _init_worker(plans, version, out_dir, fmt):
+    _worker.update(plans=plans, version=version, out_dir=out_dir, fmt=fmt, fragments={}, tracking={})
+
+
+def _radar(plan, profile):
+    from charts import radar_axes, radar_figure
+    return radar_figure(plan["cluster_r"], radar_axes(profile))
+
+
+def _tracking(cluster, plan):
+    # [(period, figure)] of a cluster, built once per worker.
+    from charts import tracking_figure
+    tracking = _worker.setdefault("tracking", {})
+    if cluster not in tracking:
+        tracking[cluster] = [(period, tracking_figure(plan["tracking"][period], kind)) for period, kind in TRACKING]
+    return tracking[cluster]
+
+
+def _div(fig, height):
+    return fig.to_html(full_html=False, include_plotlyjs=False, default_height=height,
+                       config={"displayModeBar": False})
+
+
+def render_html(farm, plan, profile, cluster, match, version):
+    fragments = _worker.setdefault("fragments", {})
+    if cluster not in fragments:
+        fragments[cluster] = "".join(f"<h3>{period} performance</h3>{_div(fig, 320)}"
+                                     for period, fig in _tracking(cluster, plan))
+    rules = "".join(
+        f'<div class="rule"><b>{i}. {html.escape(rule["item"])}</b><p><em>{html.escape(rule["desc"])}</em> '
+        f'Confidence {rule["conf"]}, lift {rule["lift"]}x</p></div>' for i, rule in enumerate(plan["rules"], 1))
+    actions = plan["actions"]
+    items = [f"<li>Secure <b>{html.escape(actions['soil'])}</b>.</li>"] if 'soil' in actions else []
+    items += [f"<li>Prepare for <b>{html.escape(actions['water'])}</b>.</li>"] if 'water' in actions else []
+    return PAGE.substitute(
+        farm=html.escape(str(farm)), plotly_js=PLOTLY_JS, cluster=cluster + 1, zone=html.escape(plan["zone"]),
+        crop=html.escape(plan["crop"]), match=f"{match:.0%}", radar=_div(_radar(plan, profile), 350), rules=rules,
+        actions="".join(items) or "<li>No practice stands out for top-yielding farms in this cluster yet.</li>",
+        tracking=fragments[cluster], version=html.escape(version))
+
+
+def report_figure(farm, plan, profile, cluster, match):
+    # The whole report as one figure (summary and basket tables, radar, tracking), for PNG / PDF export.
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+    from charts import RADAR_LAYOUT
+
+    radar = _radar(plan, profile)
+    period, chart = _tracking(cluster, plan)[0]
+    fig = make_subplots(rows=3, cols=2, row_heights=[0.3, 0.35, 0.35], vertical_spacing=0.08,
+                        specs=[[{"type": "table"}, {"type": "polar"}], [{"type": "table", "colspan": 2}, None],
+                               [{"type": "xy", "colspan": 2}, None]],
+                        subplot_titles=("Cluster identification", "Compatibility scan",
+                                        f"Resource plan for {plan['crop']}", f"{period} performance"))
+    header = dict(fill_color="#2E5A31", font=dict(color="white"), align="left")
+    fig.add_trace(go.Table(header=dict(values=["", f"Farm {farm}"], **header), cells=dict(
+        values=[["Cluster", "Zone type", "Recommended crop", "Match score"],
+                [cluster + 1, plan["zone"], plan["crop"], f"{match:.0%}"]], align="left")), row=1, col=1)
+    for trace in radar.data:
+        fig.add_trace(trace, row=1, col=2)
+    rules = plan["rules"]
+    fig.add_trace(go.Table(header=dict(values=["Practice", "Why", "Confidence", "Lift"], **header),
+                           columnwidth=[3, 5, 1, 1], cells=dict(
+        values=[[r["item"] for r in rules], [r["desc"] for r in rules], [r["conf"] for r in rules],
+                [f"{r['lift']}x" for r in rules]], align="left")), row=2, col=1)
+    for trace in chart.data:
+        fig.add_trace(trace, row=3, col=1)
+    fig.update_layout(polar=RADAR_LAYOUT["polar"], paper_bgcolor="white", plot_bgcolor="white",
+                      font=dict(color="#333333"), showlegend=False, margin=dict(l=40, r=40, t=60, b=40),
+                      title=dict(text=f"Agri-Forecast plan for farm {farm}", font=dict(color="#2E5A31")))
+    return fig
+
+
+def _render(job):
+    farm, profile, cluster, match, key = job
+    plan, fmt, out_dir = _worker["plans"][cluster], _worker["fmt"], _worker["out_dir"]
+    profile = dict(zip(FEATURES, profile))
+    path = os.path.join(out_dir, f"{safe_name(farm)}.{fmt}")
+    if fmt == "html":
+        page = render_html(farm, plan, profile, cluster, match, _worker["version"])
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.write(page)
+    else:
+        report_figure(farm, plan, profile, cluster, match).write_image(path, format=fmt, width=PAGE_SIZE[0],
+                                                                      height=PAGE_SIZE[1])
+    return farm, key
+
+
+def _render_batch(jobs):
+    return [_render(job) for job in jobs]
+
+
+# --- ORCHESTRATION ---
+def _load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST)) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(out_dir, manifest):
+    fd, tmp_path = tempfile.mkstemp(dir=out_dir, suffix=".tmp")
+    with os.fdopen(fd, "w") as fh:
+        json.dump(manifest, fh)
+    os.replace(tmp_path, os.path.join(out_dir, MANIFEST))
+
+
+def plan_jobs(profiles, recommender, digests, fmt, out_dir, manifest, force=False, start=0, names=None):
+    """(jobs to render, number skipped) for a frame of profiles; a job is (farm, profile, cluster, match, key).
+
+    Without a farm_id column, farms are numbered by row from ``start``. ``names`` maps the file
+    names planned so far to their farms, across chunks; a farm whose file is taken raises ValueError.
+    """
+    farms = profiles["farm_id"].tolist() if "farm_id" in profiles else list(range(start, start + len(profiles)))
+    X = encode_profiles(profiles)
+    cluster, match = assign(recommender.model, X)
+    jobs, skipped = [], 0
+    for farm, profile, c, m in zip(farms, X.tolist(), cluster.tolist(), match.tolist()):
+        name = safe_name(farm)
+        if names is not None:
+            # One report per file: a repeated id (or, in theory, a hash collision) would overwrite another.
+            if name in names:
+                raise ValueError(f"farms {names[name]!r} and {farm!r} would both be written to {name}.{fmt}")
+            names[name] = farm
+        key = content_key(recommender.version, fmt, profile, c, m, digests[c])
+        entry = manifest.get(str(farm))
+        if not force and entry == key and os.path.exists(os.path.join(out_dir, f"{name}.{fmt}")):
+            skipped += 1
+            continue
+        jobs.append((farm, profile, c, m, key))
+    return jobs, skipped
+
+
+def write_index(out_dir, manifest, fmt):
+    links = "".join(f'<li><a href="{html.escape(safe_name(farm))}.{fmt}">Farm {html.escape(farm)}</a></li>'
+                    for farm in sorted(manifest))
+    with open(os.path.join(out_dir, "index.html"), "w", encoding="utf-8") as fh:
+        fh.write(f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>Agri-Forecast reports</title></head>"
+                 f"<body><h1>Agri-Forecast reports</h1><ul>{links}</ul></body></html>")
+
+
+def generate_reports(path, out_dir, fmt="html", processes=None, batch=50, force=False, chunksize=200_000):
+    """Render a report per profile in ``path`` into ``out_dir``; returns (rendered, skipped)."""
+    from artifacts import current_artifact, training_history
+    from batch_score import iter_chunks
+    from core import Recommender
+    from forecast import cluster_forecaster
+
+    artifact = current_artifact()
+    recommender = Recommender(artifact)
+    plans = cluster_plans(recommender, cluster_forecaster(artifact.model, training_history(artifact)))
+    os.makedirs(out_dir, exist_ok=True)
+    if fmt == "html" and not os.path.exists(os.path.join(out_dir, PLOTLY_JS)):
+        from plotly.offline import get_plotlyjs
+        with open(os.path.join(out_dir, PLOTLY_JS), "w", encoding="utf-8") as fh:
+            fh.write(get_plotlyjs())
+
+    manifest = _load_manifest(out_dir)
+    digests = {c: plan_digest(plan) for c, plan in plans.items()}
+    jobs, skipped, rows, names = [], 0, 0, {}
+    for chunk in iter_chunks(path, chunksize):
+        chunk_jobs, chunk_skipped = plan_jobs(chunk, recommender, digests, fmt, out_dir, manifest, force, rows,
+                                              names)
+        jobs += chunk_jobs
+        skipped += chunk_skipped
+        rows += len(chunk)
+
+    rendered = 0
+    if jobs:
+        with ProcessPoolExecutor(processes, initializer=_init_worker,
+                                 initargs=(plans, recommender.version, out_dir, fmt)) as pool:
+            futures = [pool.submit(_render_batch, jobs[i:i + batch]) for i in range(0, len(jobs), batch)]
+            for future in as_completed(futures):
+                for farm, key in future.result():
+                    manifest[str(farm)] = key
+                    rendered += 1
+                _write_manifest(out_dir, manifest)
+    write_index(out_dir, manifest, fmt)
+    return rendered, skipped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render static per-farm plan reports in bulk.")
+    parser.add_argument('input', help="CSV, JSON-lines or Parquet file of farm profiles")
+    parser.add_argument('-o', '--output', default="reports", help="output directory")
+    parser.add_argument('--format', choices=FORMATS, default="html")
+    parser.add_argument('--processes', type=int, help="worker processes (default: all cores)")
+    parser.add_argument('--batch', type=int, default=50, help="reports per worker task")
+    parser.add_argument('--force', action='store_true', help="render every report, even if unchanged")
+    args = parser.parse_args(argv)
+
+    if args.format != "html":
+        try:
+            import kaleido  # noqa: F401
+        except ImportError:
+            parser.error(f"--format {args.format} needs kaleido (pip install kaleido)")
+    start = time.perf_counter()
+    try:
+        rendered, skipped = generate_reports(args.input, args.output, args.format, args.processes, args.batch,
+                                             args.force)
+    except ValueError as exc:
+        print(f"Cannot render reports: {exc}", file=sys.stderr)
+        return 1
+    print(f"Rendered {rendered} reports, skipped {skipped} unchanged, in {time.perf_counter() - start:.1f}s "
+          f"-> {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
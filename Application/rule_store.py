@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+from blockfile import read_blocks, write_blocks
+
+
+def rule_arrays(rule_table):
+    """Lay a mined rule table out as (columns, meta), grouped by (cluster, crop, type).
+
+    Rows are sorted by lift then confidence (descending) inside each group, and the group
+    boundaries are stored alongside, so a lookup is a slice rather than a scan or a sort.
+    """
+    table = rule_table.sort_values(["cluster", "crop", "type", "lift", "confidence"],
+                                   ascending=[True, True, True, False, False], ignore_index=True)
+    crop_codes, crops = pd.factorize(table["crop"].astype(str), sort=True)
+    type_codes, types = pd.factorize(table["type"].astype(str), sort=True)
+    item_codes, items = pd.factorize(table["item"].astype(str))
+    desc_codes, descs = pd.factorize(table["desc"].astype(str))
+
+    cluster = table["cluster"].to_numpy(np.int16)
+    keys = np.column_stack([cluster, crop_codes, type_codes])
+    boundary = np.flatnonzero(np.any(np.diff(keys, axis=0) != 0, axis=1)) + 1 if len(keys) else np.array([], int)
+    starts = np.concatenate([[0], boundary]).astype(np.int64) if len(keys) else np.zeros(0, np.int64)
+    ends = np.append(starts[1:], len(keys)).astype(np.int64)
+
+    return {
+        "cluster": cluster,
+        "crop": crop_codes.astype(np.int16),
+        "type": type_codes.astype(np.int8),
+        "item": item_codes.astype(np.int32),
+        "desc": desc_codes.astype(np.int32),
+        "n_items": table["n_items"].to_numpy(np.int8),
+        "support": table["support"].to_numpy(np.float32),
+        "confidence": table["confidence"].to_numpy(np.float32),
+        "lift": table["lift"].to_numpy(np.float32),
+        "index_key": keys[starts].astype(np.int32) if len(keys) else np.zeros((0, 3), np.int32),
+        "index_start": starts,
+        "index_end": ends,
+    }, {"crops": list(crops), "types": list(types), "items": list(items), "descs": list(descs)}
+
+
+def write_rule_store(rule_table, path):
+    columns, meta = rule_arrays(rule_table)
+    return write_blocks(path, columns, meta=meta)
+
+
+class RuleStore:
+    """Read-only, memory-mapped rule store with top-k lookup per (cluster, crop, resource type)."""
+
+    def __init__(self, columns, meta):
+        self.columns = columns
+        self.crops = meta["crops"]
+        self.types = meta["types"]
+        self.items = meta["items"]
+        self.descs = meta["descs"]
+        crop_names, type_names = np.array(self.crops, dtype=object), np.array(self.types, dtype=object)
+        self.index = {}
+        for (cluster, crop, kind), start, end in zip(self.columns["index_key"].tolist(),
+                                                     self.columns["index_start"].tolist(),
+                                                     self.columns["index_end"].tolist()):
+            self.index[(cluster, crop_names[crop], type_names[kind])] = (start, end)
+
+    @classmethod
+    def open(cls, path):
+        meta, columns = read_blocks(path)
+        return cls(columns, meta)
+
+    def __len__(self):
+        return len(self.columns["lift"])
+
+    def _slice(self, start, end, k, min_confidence, min_lift):
+        lift = self.columns["lift"]
+        # Lift is descending within a group, so the min-lift cut is a binary search.
+        end = start + int(np.searchsorted(-lift[start:end], -np.float32(min_lift), side="right"))
+        rows = np.arange(start, end)
+        if min_confidence > 0:
+            rows = rows[self.columns["confidence"][start:end] >= min_confidence]
+        return rows[:k]
+
+    def _row(self, i):
+        c = self.columns
+        return {"item": self.items[c["item"][i]], "type": self.types[c["type"][i]],
+                "conf": f"{c['confidence'][i]:.0%}", "lift": round(float(c["lift"][i]), 1),
+                "support": float(c["support"][i]), "desc": self.descs[c["desc"][i]]}
+
+    def top_k(self, cluster, crop, resource_type=None, k=5, min_confidence=0.0, min_lift=0.0):
+        types = [resource_type] if resource_type is not None else self.types
+        rows = [self._slice(*self.index[(cluster, crop, kind)], k, min_confidence, min_lift)
+                for kind in types if (cluster, crop, kind) in self.index]
+        rows = np.concatenate(rows) if rows else np.zeros(0, np.int64)
+        if len(types) > 1:
+            order = np.lexsort((-self.columns["confidence"][rows], -self.columns["lift"][rows]))
+            rows = rows[order[:k]]
+        return [self._row(i) for i in rows]
+
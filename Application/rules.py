@@ -0,0 +1,231 @@
+import numpy as np
+import pandas as pd
+
+# --- RESOURCE CATALOGUE ---
+# Practices that can appear in a farm's transaction, with the resource type and the planner blurb.
+RESOURCE_ITEMS = {
+    "Urea Fertilizer (High N)": {"type": "soil", "desc": "Essential for leafy growth in wet conditions."},
+    "DAP Fertilizer (NP Mix)": {"type": "soil", "desc": "Crucial for root development and stalk strength."},
+    "Bio-Compost Application": {"type": "soil", "desc": "Improves soil structure in sandy textures."},
+    "Potash (MOP) Top-Dressing": {"type": "soil", "desc": "Strengthens stems and improves grain filling."},
+    "Flooding Irrigation (Weekly)": {"type": "water", "desc": "Maintains anaerobic soil conditions."},
+    "Sprinkler Irrigation": {"type": "water", "desc": "Ensures even coverage during tasseling."},
+    "Drip Irrigation": {"type": "water", "desc": "Prevents root rot by delivering water directly."},
+    "Rainwater Harvesting": {"type": "water", "desc": "Buffers dry spells with stored monsoon runoff."},
+}
+
+# Column dtypes of a mined rule table.
+RULE_COLUMNS = {
+    "cluster": "int16",
+    "crop": "category",
+    "item": "string",
+    "type": "category",
+    "n_items": "int8",
+    "support": "float32",
+    "confidence": "float32",
+    "lift": "float32",
+    "desc": "string",
+}
+
+# Popcount of every byte value, for counting set bits in packed bitsets.
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def encode_practices(practices, sep=";"):
+    # ';'-joined practice strings -> (bool matrix, item names). Only distinct baskets are split.
+    codes, uniques = pd.factorize(practices.fillna(""))
+    dummies = pd.Series(uniques).str.get_dummies(sep=sep)
+    dummies = dummies.loc[:, dummies.columns != ""]
+    return dummies.to_numpy(dtype=bool)[codes], list(dummies.columns)
+
+
+def _count(bits):
+    return int(_POPCOUNT[bits].sum(dtype=np.int64))
+
+
+def _frequent_itemsets(item_bits, high_bits, min_count, max_len):
+    # Bitset Apriori over itemsets that co-occur with high yield. Yields (itemset, n_itemset, n_itemset_high).
+    level = {}
+    for i, bits in enumerate(item_bits):
+        hit = _count(bits & high_bits)
+        if hit >= min_count:
+            level[(i,)] = bits
+            yield (i,), _count(bits), hit
+
+    for _ in range(2, max_len + 1):
+        keys = sorted(level)
+        frequent = set(keys)
+        next_level = {}
+        for a in range(len(keys)):
+            for b in range(a + 1, len(keys)):
+                left, right = keys[a], keys[b]
+                if left[:-1] != right[:-1]:
+                    break
+                candidate = left + right[-1:]
+                # Apriori pruning: every (k-1)-subset must itself be frequent.
+                if any(candidate[:j] + candidate[j + 1:] not in frequent for j in range(len(candidate) - 2)):
+                    continue
+                bits = level[left] & item_bits[right[-1]]
+                hit = _count(bits & high_bits)
+                if hit >= min_count:
+                    next_level[candidate] = bits
+                    yield candidate, _count(bits), hit
+        if not next_level:
+            break
+        level = next_level
+
+
+def mine_rules(transactions, min_support=0.02, min_confidence=0.3, min_lift=1.0, max_len=2, top_quantile=0.75):
+    """Mine `practices -> top-yield` rules for every (cluster, crop) group of a transactions table.
+
+    ``transactions`` needs ``cluster``, ``crop``, ``yield`` and ``practices`` (';'-joined) columns.
+    A farm is high-yield when it sits in the top quartile of its own group.
+    """
+    onehot, items = encode_practices(transactions["practices"])
+    groups = transactions.groupby(["cluster", "crop"], sort=True).indices
+    yields = transactions["yield"].to_numpy()
+
+    records = []
+    for (cluster, crop), rows in groups.items():
+        group_yield = yields[rows]
+        high = group_yield >= np.quantile(group_yield, top_quantile)
+        n, n_high = len(rows), int(high.sum())
+        if n_high == 0:
+            continue
+        item_bits = np.packbits(onehot[rows], axis=0).T.copy()
+        high_bits = np.packbits(high)
+        min_count = max(1, int(np.ceil(min_support * n)))
+
+        for itemset, n_itemset, n_hit in _frequent_itemsets(item_bits, high_bits, min_count, max_len):
+            confidence = n_hit / n_itemset
+            lift = confidence / (n_high / n)
+            if confidence < min_confidence or lift < min_lift:
+                continue
+            records.append(_rule_record(cluster, crop, [items[i] for i in itemset], n, n_hit, confidence, lift))
+    return _rule_table(records)
+
+
+def _rule_record(cluster, crop, names, n, n_hit, confidence, lift):
+    types = {RESOURCE_ITEMS.get(name, {}).get("type", "other") for name in names}
+    return (cluster, crop, " + ".join(names), types.pop() if len(types) == 1 else "mixed",
+            len(names), n_hit / n, confidence, lift,
+            " ".join(RESOURCE_ITEMS.get(name, {}).get("desc", "") for name in names).strip())
+
+
+def _rule_table(records):
+    table = pd.DataFrame.from_records(records, columns=list(RULE_COLUMNS)).astype(RULE_COLUMNS)
+    return table.sort_values(["cluster", "crop", "lift", "confidence"],
+                             ascending=[True, True, False, False], ignore_index=True)
+
+
+class RuleCounter:
+    """Running itemset counts per (cluster, crop), for rule tables that stay fresh without re-mining.
+
+    Counts single practices and pairs (``mine_rules``' default ``max_len=2``) as co-occurrence
+    matrices, overall and among high-yield farms. The high-yield cut-off of each group is the
+    ``top_quantile`` of a log-spaced yield histogram, so it follows the data as batches arrive;
+    a batch is classified against the cut-off as it stood when the batch was added.
+    """
+
+    BINS = np.geomspace(1.0, 1e6, 1025)
+
+    def __init__(self, items=None, top_quantile=0.75):
+        self.items = sorted(items or RESOURCE_ITEMS)  # encode_practices order, so pair names match
+        self.top_quantile = top_quantile
+        self.groups = {}
+
+    def _group(self, key):
+        if key not in self.groups:
+            m = len(self.items)
+            self.groups[key] = {"n": 0, "n_high": 0, "co": np.zeros((m, m), np.int64),
+                                "co_high": np.zeros((m, m), np.int64),
+                                "hist": np.zeros(len(self.BINS) - 1, np.int64)}
+        return self.groups[key]
+
+    def _threshold(self, group, yields):
+        hist = group["hist"]
+        total = hist.sum()
+        if total == 0:
+            return np.quantile(yields, self.top_quantile)
+        b = int(np.searchsorted(np.cumsum(hist), self.top_quantile * total))
+        return self.BINS[min(b, len(hist) - 1)]
+
+    def add(self, transactions):
+        # Same columns as mine_rules: cluster, crop, yield and ';'-joined practices.
+        onehot, names = encode_practices(transactions["practices"])
+        known = [j for j, name in enumerate(names) if name in self.items]
+        basket = np.zeros((len(transactions), len(self.items)), np.int64)
+        basket[:, [self.items.index(names[j]) for j in known]] = onehot[:, known]
+        yields = transactions["yield"].to_numpy(np.float64)
+        for key, rows in transactions.groupby(["cluster", "crop"], sort=False).indices.items():
+            group = self._group((int(key[0]), key[1]))
+            b, y = basket[rows], yields[rows]
+            high = y >= self._threshold(group, y)
+            group["n"] += len(rows)
+            group["n_high"] += int(high.sum())
+            group["co"] += b.T @ b
+            group["co_high"] += b[high].T @ b[high]
+            group["hist"] += np.histogram(y, self.BINS)[0]
+        return self
+
+    def rules(self, min_support=0.02, min_confidence=0.3, min_lift=1.0):
+        # Rule table in mine_rules' format from the current counts.
+        records = []
+        for (cluster, crop), group in sorted(self.groups.items()):
+            n, n_high = group["n"], group["n_high"]
+            if n_high == 0:
+                continue
+            co, co_high = group["co"], group["co_high"]
+            min_count = max(1, int(np.ceil(min_support * n)))
+            frequent = {i for i in range(len(self.items)) if co_high[i, i] >= min_count}
+            itemsets = [(i,) for i in sorted(frequent)]
+            itemsets += [(i, j) for i in sorted(frequent) for j in sorted(frequent) if i < j]
+            for itemset in itemsets:
+                i, j = itemset[0], itemset[-1]
+                n_hit, n_itemset = co_high[i, j], co[i, j]
+                if n_hit < min_count:
+                    continue
+                confidence = n_hit / n_itemset
+                lift = confidence / (n_high / n)
+                if confidence < min_confidence or lift < min_lift:
+                    continue
+                records.append(_rule_record(cluster, crop, [self.items[k] for k in itemset], n, n_hit,
+                                            confidence, lift))
+        return _rule_table(records)
+
+
+def build_transactions(history, labels):
+    # One transaction per historical farm: its cluster label, crop, yield and practice basket.
+    return pd.DataFrame({
+        "cluster": labels,
+        "crop": history["crop"],
+        "yield": history["yield"],
+        "practices": history["practices"],
+    })
+
+
+def select_basket(rules, k=4):
+    # Highest-lift rules first, skipping any that add no practice beyond those already chosen.
+    basket, covered = [], set()
+    for rule in rules:
+        items = set(rule["item"].split(" + "))
+        if items <= covered:
+            continue
+        basket.append(rule)
+        covered |= items
+        if len(basket) == k:
+            break
+    return basket
+
+
+def basket_items(basket):
+    # Distinct practices named by a basket's rules, in rule order.
+    return list(dict.fromkeys(item for rule in basket for item in rule["item"].split(" + ")))
+
+
+def key_actions(basket):
+    # First practice of each resource type in the basket, e.g. {"soil": ..., "water": ...}.
+    actions = {}
+    for item in basket_items(basket):
+        actions.setdefault(RESOURCE_ITEMS.get(item, {}).get("type", "other"), item)
+    return actions
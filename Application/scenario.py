@@ -0,0 +1,122 @@
+"""What-if sweeps: the recommendation for every point of a grid of input perturbations at once.
+
+The model's standardized squared distance is a sum of per-feature terms, so for a grid the distance
+of every point to every centroid is the broadcast sum of one small (steps x clusters) table per swept
+feature; the grid of profiles itself is never materialized. A 10^6-point sweep is one broadcast
+sum, one argmin and table lookups for crop and basket.
+"""
+import numpy as np
+import pandas as pd
+
+from clustering import FEATURES, encode_profiles
+from history import FEATURE_NOISE, FEATURE_RANGES
+
+SWEEP_FEATURES = ['N', 'P', 'K', 'ph', 'temp', 'rainfall']
+MAX_POINTS = 2_000_000
+
+
+def default_ranges(profile, features=SWEEP_FEATURES, steps=10, spread=2.5):
+    # Axis values around the profile: +/- `spread` typical farm-to-farm deviations, within the form's limits.
+    ranges = {}
+    for feature in features:
+        low, high = FEATURE_RANGES[feature]
+        base = float(profile[feature])
+        width = spread * FEATURE_NOISE[feature]
+        ranges[feature] = np.linspace(max(low, base - width), min(high, base + width), steps)
+    return ranges
+
+
+class Sweep:
+    """Cluster assignment over the Cartesian grid of ``ranges``, all other fields held at ``profile``.
+
+    ``cluster`` has one axis per swept feature (in ``features`` order). Each axis contains the
+    profile's own value, so the base scenario is a grid point.
+    """
+
+    def __init__(self, recommender, profile, ranges):
+        self.features = [f for f in FEATURES if f in ranges]
+        self.base = {f: float(profile[f]) for f in FEATURES}
+        self.axes = [np.unique(np.append(np.asarray(ranges[f], dtype=np.float64), self.base[f]))
+                     for f in self.features]
+        points = int(np.prod([len(axis) for axis in self.axes]))
+        if points > MAX_POINTS:
+            raise ValueError(f"a sweep of {points:,} points exceeds the limit of {MAX_POINTS:,}")
+        self.base_index = tuple(int(np.searchsorted(axis, self.base[f])) for f, axis in zip(self.features, self.axes))
+
+        model = recommender.model
+        centers = model.centers_
+        k = len(centers)
+        fixed = model._scale(encode_profiles(self.base))[0]
+        dist = np.zeros(k)
+        for j, feature in enumerate(FEATURES):
+            if feature not in ranges:
+                dist = dist + (fixed[j] - centers[:, j]) ** 2
+        for d, feature in enumerate(self.features):
+            j = FEATURES.index(feature)
+            scaled = (self.axes[d] - model.mean_[j]) / model.scale_[j]
+            shape = [1] * len(self.features) + [k]
+            shape[d] = len(scaled)
+            dist = dist + ((scaled[:, None] - centers[None, :, j]) ** 2).reshape(shape)
+        self.cluster = np.argmin(dist, axis=-1).astype(np.int16)
+
+        self.crops = sorted({info['crop'] for info in recommender.clusters.values()})
+        self.crop_of = np.array([self.crops.index(recommender.clusters[c]['crop']) for c in range(k)])
+        baskets = [tuple(recommender.items[c]) for c in range(k)]
+        self.basket_of = np.array([sorted(set(baskets)).index(basket) for basket in baskets])
+        self.zones = [recommender.clusters[c]['name'] for c in range(k)]
+        self.base_cluster = int(self.cluster[self.base_index])
+
+    def __len__(self):
+        return self.cluster.size
+
+    @property
+    def crop(self):
+        return self.crop_of[self.cluster]
+
+    def boundary_map(self, x, y):
+        """Recommended crop over the (x, y) plane with the other features at the profile's values.
+
+        Returns (crop codes, clusters, agreement), each shaped (len(y axis), len(x axis)); agreement
+        is the share of scenarios over all the other swept features that give the same crop.
+        """
+        dx, dy = self.features.index(x), self.features.index(y)
+        if dx == dy:
+            raise ValueError("the map needs two different features")
+        index = list(self.base_index)
+        index[dx] = index[dy] = slice(None)
+        clusters = self.cluster[tuple(index)]
+        if dx < dy:
+            clusters = clusters.T  # rows follow y, columns follow x
+        crop = self.crop_of[clusters]
+        grid = np.moveaxis(self.crop, [dy, dx], [0, 1]).reshape(len(self.axes[dy]), len(self.axes[dx]), -1)
+        agreement = (grid == crop[:, :, None]).mean(axis=2)
+        return crop, clusters, agreement
+
+    def sensitivity(self):
+        # One feature at a time (others at the profile): how much of its range keeps the base crop and
+        # the nearest values that change it; the last row moves every swept feature jointly.
+        base_crop = self.crop_of[self.base_cluster]
+        base_basket = self.basket_of[self.base_cluster]
+        rows = []
+        for d, feature in enumerate(self.features):
+            index = list(self.base_index)
+            index[d] = slice(None)
+            clusters = self.cluster[tuple(index)]
+            line = self.crop_of[clusters]
+            axis, base = self.axes[d], self.base_index[d]
+            below = np.flatnonzero(line[:base] != base_crop)
+            above = np.flatnonzero(line[base + 1:] != base_crop)
+            rows.append({
+                "feature": feature,
+                "range": f"{axis[0]:g} - {axis[-1]:g}",
+                "keeps_crop": float(np.mean(line == base_crop)),
+                "keeps_basket": float(np.mean(self.basket_of[clusters] == base_basket)),
+                "flips_below": float(axis[below[-1]]) if len(below) else np.nan,
+                "flips_above": float(axis[base + 1 + above[0]]) if len(above) else np.nan,
+            })
+        rows.sort(key=lambda row: row["keeps_crop"])
+        rows.append({"feature": "all together", "range": f"{len(self):,} scenarios",
+                     "keeps_crop": float(np.mean(self.crop == base_crop)),
+                     "keeps_basket": float(np.mean(self.basket_of[self.cluster] == base_basket)),
+                     "flips_below": np.nan, "flips_above": np.nan})
+        return pd.DataFrame(rows)
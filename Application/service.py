@@ -0,0 +1,309 @@
+"""Headless recommendation API over the app's model core.
+
+Usage: python service.py [--host 0.0.0.0] [--port 8080] [--max-batch 512] [--max-wait-ms 2] [--lut]
+
+    POST /recommend   one profile object, or a list of them -> recommendation(s) as JSON
+    GET  /healthz     model version and queue depth
+    GET  /metrics     Prometheus text of the request timings
+
+Requests that arrive close together are coalesced into one micro-batch, so the model runs a single
+vectorized call per batch instead of one per request. The published artifact is re-checked every
+few seconds and swapped in without a restart. With ``--lut`` clusters come from the artifact's
+quantized lookup table (see lut.py), built on first load of each version. New versions load in a
+worker thread while the last good one keeps serving, also if they cannot be loaded; with none
+loaded, /recommend answers 503.
+Standard library only, plus numpy/pandas via the core.
+"""
+import argparse
+import asyncio
+import functools
+import json
+import sys
+import time
+
+from artifacts import MODEL_DIR, current_artifact_path, load_artifact
+from core import Recommender, invalid_fields, missing_fields
+from profiling import export_prometheus, record
+
+MAX_BODY = 1 << 20
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class ModelUnavailable(RuntimeError):
+    """No model artifact could be loaded."""
+
+
+@functools.lru_cache(maxsize=2)
+def load_recommender(path, lut=False):
+    artifact = load_artifact(path)
+    if lut:
+        from lut import LookupRecommender, load_lookup_table
+        return LookupRecommender(artifact, load_lookup_table(artifact))
+    return Recommender(artifact)
+
+
+class ModelRef:
+    # The live recommender; the CURRENT pointer is re-read at most every `interval` seconds.
+
+    def __init__(self, model_dir=MODEL_DIR, interval=5.0, lut=False):
+        self.model_dir = model_dir
+        self.interval = interval
+        self.lut = lut
+        self.checked = 0.0
+        self.path = None
+        self.recommender = None
+        self.loading = None  # future of a load running in the default executor
+        self.error = None
+
+    def get(self):
+        now = time.monotonic()
+        if now - self.checked > self.interval:
+            self.checked = now
+            self._check()
+        if self.recommender is None:
+            raise ModelUnavailable(self.error or "model is still loading")
+        return self.recommender
+
+    async def ready(self):
+        # Load the published model before accepting traffic; raises ModelUnavailable if there is none.
+        self.checked = time.monotonic()
+        loading = self._check()
+        if loading is not None:
+            await asyncio.wait([loading])
+        return self.get()
+
+    def _check(self):
+        # A newly published artifact (and with --lut its table, ~6s to build) loads in a thread, off the
+        # event loop; the last good model keeps serving until it is ready, or if it cannot be loaded.
+        if self.loading is not None:
+            return self.loading
+        try:
+            path = current_artifact_path(self.model_dir)
+        except FileNotFoundError as exc:
+            self.error = str(exc)
+            return None
+        if path != self.path:
+            self.loading = asyncio.get_running_loop().run_in_executor(None, load_recommender, path, self.lut)
+            self.loading.add_done_callback(functools.partial(self._loaded, path))
+        return self.loading
+
+    def _loaded(self, path, future):
+        self.loading = None
+        try:
+            self.recommender = future.result()
+        except Exception as exc:
+            self.error = f"{type(exc).__name__}: {exc}"
+        else:
+            self.path, self.error = path, None
+
+
+class MicroBatcher:
+    """Queue of pending requests drained in batches of up to ``max_batch`` profiles.
+
+    A batch closes when it is full or ``max_wait`` seconds after its first request arrived,
+    whichever comes first; under light load a request therefore waits at most ``max_wait``.
+    """
+
+    def __init__(self, model, max_batch=512, max_wait=0.002):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue()
+        self.worker = None
+
+    def start(self):
+        self.worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, profiles):
+        if self.worker is None or self.worker.done():
+            self.start()  # nothing would ever resolve the future otherwise
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((profiles, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self.queue.get()]
+            size = len(pending[0][0])
+            deadline = loop.time() + self.max_wait
+            while size < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                pending.append(item)
+                size += len(item[0])
+            self._score(pending)
+
+    def _score(self, pending):
+        start = time.perf_counter()
+        try:
+            recommender = self.model.get()
+            profiles = [profile for request, _ in pending for profile in request]
+            try:
+                results = recommender.recommend_batch(profiles)
+            except (ValueError, TypeError, KeyError):
+                # A malformed value somewhere in the batch: score requests one by one so it only fails its own.
+                for request, future in pending:
+                    self._resolve(future, recommender, request)
+            else:
+                offset = 0
+                for request, future in pending:
+                    if not future.done():
+                        future.set_result(results[offset:offset + len(request)])
+                    offset += len(request)
+        except Exception as exc:
+            # No model, or a bug: fail this batch's requests, but keep the worker alive for the next one.
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(exc)
+        record("service.batch", time.perf_counter() - start)
+
+    @staticmethod
+    def _resolve(future, recommender, request):
+        if future.done():
+            return
+        try:
+            future.set_result(recommender.recommend_batch(request))
+        except (ValueError, TypeError, KeyError) as exc:
+            future.set_exception(ValueError(f"invalid profile: {exc}"))
+
+
+def response(status, payload, keep_alive=True, content_type="application/json"):
+    body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+    head = (f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode() + body
+
+
+async def handle_recommend(batcher, body):
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return 400, {"error": "body is not valid JSON"}
+    single = isinstance(payload, dict)
+    profiles = [payload] if single else payload
+    if not isinstance(profiles, list) or not profiles or not all(isinstance(p, dict) for p in profiles):
+        return 400, {"error": "expected a profile object or a non-empty list of them"}
+    missing = sorted({field for p in profiles for field in missing_fields(p)})
+    if missing:
+        return 400, {"error": "missing profile fields", "missing": missing}
+    invalid = sorted({field for p in profiles for field in invalid_fields(p)})
+    if invalid:
+        return 400, {"error": "profile fields must be finite numbers", "invalid": invalid}
+    try:
+        results = await batcher.submit(profiles)
+    except ModelUnavailable as exc:
+        return 503, {"error": f"no model available: {exc}"}
+    except ValueError as exc:
+        return 400, {"error": str(exc)}
+    return 200, results[0] if single else results
+
+
+async def route(batcher, method, path, body):
+    path = path.split("?", 1)[0]
+    if path == "/recommend":
+        if method != "POST":
+            return 405, {"error": "use POST"}
+        start = time.perf_counter()
+        status, payload = await handle_recommend(batcher, body)
+        record("service.recommend", time.perf_counter() - start)
+        return status, payload
+    if path == "/healthz" and method == "GET":
+        try:
+            version = batcher.model.get().version
+        except ModelUnavailable as exc:
+            return 503, {"status": "unavailable", "error": str(exc), "queued": batcher.queue.qsize()}
+        health = {"status": "degraded" if batcher.model.error else "ok", "model_version": version,
+                  "queued": batcher.queue.qsize()}
+        if batcher.model.error:
+            health["error"] = batcher.model.error
+        return 200, health
+    if path == "/metrics" and method == "GET":
+        return 200, export_prometheus().encode()
+    return 404, {"error": f"no route for {method} {path}"}
+
+
+async def serve_connection(batcher, reader, writer):
+    # Minimal HTTP/1.1: Content-Length bodies and keep-alive; no chunked uploads.
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            try:
+                method, path, version = request_line.decode("latin-1").split()
+            except ValueError:
+                writer.write(response(400, {"error": "malformed request line"}, keep_alive=False))
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            keep_alive = (headers.get("connection", "").lower() != "close" if version == "HTTP/1.1"
+                          else headers.get("connection", "").lower() == "keep-alive")
+            try:
+                length = int(headers.get("content-length") or 0)
+            except ValueError:
+                length = -1
+            if length < 0:
+                writer.write(response(400, {"error": "invalid Content-Length"}, keep_alive=False))
+                break
+            if length > MAX_BODY:
+                writer.write(response(413, {"error": f"body exceeds {MAX_BODY} bytes"}, keep_alive=False))
+                break
+            body = await reader.readexactly(length) if length else b""
+            try:
+                status, payload = await route(batcher, method, path, body)
+            except Exception as exc:
+                status, payload = 500, {"error": f"{type(exc).__name__}: {exc}"}
+            content_type = "text/plain; version=0.0.4" if isinstance(payload, bytes) else "application/json"
+            writer.write(response(status, payload, keep_alive, content_type))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host="127.0.0.1", port=8080, max_batch=512, max_wait=0.002, model_dir=MODEL_DIR, lut=False):
+    batcher = MicroBatcher(ModelRef(model_dir, lut=lut), max_batch=max_batch, max_wait=max_wait)
+    await batcher.model.ready()
+    batcher.start()
+    server = await asyncio.start_server(functools.partial(serve_connection, batcher), host, port)
+    print(f"Serving model {batcher.model.get().version} on http://{host}:{port}", file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve cluster, crop and resource recommendations over HTTP.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--max-batch', type=int, default=512, help="profiles per model call")
+    parser.add_argument('--max-wait-ms', type=float, default=2.0, help="longest a request waits for a batch")
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    parser.add_argument('--lut', action='store_true', help="assign clusters from the quantized lookup table")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.max_batch, args.max_wait_ms / 1000, args.model_dir, args.lut))
+    except ModelUnavailable as exc:
+        print(f"No model to serve: {exc}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
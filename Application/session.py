@@ -0,0 +1,179 @@
+"""Compact per-session state and process-wide memory accounting for the app's sessions.
+
+``st.session_state`` keeps only small handles: a ``ProfileRecord``, the cluster ID, the model
+path and the step. Anything derived and recomputable (timelines, per-session scratch data) lives
+in a ``SessionRegistry`` entry outside Streamlit's state, where it can be measured per session,
+capped at a byte budget, and dropped once the session goes idle. Figures and data frames are
+shared across sessions through ``SharedCache`` and Streamlit's caches rather than copied per session.
+"""
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from clustering import FEATURES
+
+SESSION_BUDGET = int(os.environ.get("AGRI_SESSION_BUDGET", 256 * 1024))  # derived bytes kept per session
+SESSION_IDLE = float(os.environ.get("AGRI_SESSION_IDLE", 900))  # seconds before derived data is dropped
+
+
+class ProfileRecord:
+    """One farm profile from the input form: eight floats and no per-instance ``__dict__``."""
+
+    __slots__ = tuple(FEATURES)
+
+    def __init__(self, **values):
+        for feature in FEATURES:
+            value = values[feature]
+            if feature == 'irrigation' and isinstance(value, str):
+                value = value.strip().lower() in ('yes', 'true', '1')
+            object.__setattr__(self, feature, float(value))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ProfileRecord is immutable")
+
+    def __getitem__(self, feature):
+        return getattr(self, feature)
+
+    def __eq__(self, other):
+        return isinstance(other, ProfileRecord) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return f"ProfileRecord({', '.join(f'{f}={getattr(self, f)!r}' for f in FEATURES)})"
+
+    def __getstate__(self):
+        return self.key()
+
+    def __setstate__(self, state):
+        for feature, value in state:
+            object.__setattr__(self, feature, value)
+
+    def as_dict(self):
+        return {feature: getattr(self, feature) for feature in FEATURES}
+
+    def key(self):
+        # Hashable (field, value) pairs, e.g. for cache keys.
+        return tuple((feature, getattr(self, feature)) for feature in FEATURES)
+
+
+def approx_size(obj, _seen=None):
+    # Rough retained size in bytes: containers are walked, arrays and frames report their buffers.
+    seen = set() if _seen is None else _seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        return sys.getsizeof(obj) + (obj.nbytes if obj.base is None else 0)
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return int(np.sum(obj.memory_usage(deep=True)))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(approx_size(k, seen) + approx_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(approx_size(item, seen) for item in obj)
+    elif hasattr(type(obj), '__slots__'):
+        size += sum(approx_size(getattr(obj, name), seen) for name in type(obj).__slots__ if hasattr(obj, name))
+    return size
+
+
+class _Entry:
+    __slots__ = ('last_seen', 'derived', 'state_bytes')
+
+    def __init__(self):
+        self.last_seen = time.time()
+        self.derived = OrderedDict()
+        self.state_bytes = 0
+
+
+class SessionRegistry:
+    """Derived data and memory accounting for every live session, shared by the whole process."""
+
+    def __init__(self, budget=SESSION_BUDGET, max_idle=SESSION_IDLE, sweep_every=30.0):
+        self.budget = budget
+        self.max_idle = max_idle
+        self.sweep_every = sweep_every
+        self.evicted = 0
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+
+    def derived(self, session_id):
+        # The session's derived-data dict (insertion-ordered; the oldest keys are evicted first).
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = self._sessions[session_id] = _Entry()
+            entry.last_seen = time.time()
+            return entry.derived
+
+    def touch(self, session_id, state):
+        """End-of-rerun bookkeeping: measure ``state``, enforce the budget, sweep idle sessions."""
+        state_bytes = approx_size(dict(state))
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = self._sessions[session_id] = _Entry()
+            entry.last_seen = time.time()
+            entry.state_bytes = state_bytes
+            while entry.derived and approx_size(entry.derived) > self.budget:
+                entry.derived.popitem(last=False)
+                self.evicted += 1
+        if time.time() - self._last_sweep > self.sweep_every:
+            self.sweep()
+
+    def sweep(self, now=None):
+        # Forget sessions idle for longer than max_idle, together with their derived data.
+        now = time.time() if now is None else now
+        with self._lock:
+            self._last_sweep = now
+            stale = [sid for sid, entry in self._sessions.items() if now - entry.last_seen > self.max_idle]
+            for sid in stale:
+                del self._sessions[sid]
+            self.evicted += len(stale)
+        return len(stale)
+
+    def report(self):
+        # One row per session, largest first.
+        now = time.time()
+        with self._lock:
+            rows = [{"session": sid, "state_bytes": entry.state_bytes, "derived_bytes": approx_size(entry.derived),
+                     "derived_keys": len(entry.derived), "idle_s": round(now - entry.last_seen, 1)}
+                    for sid, entry in self._sessions.items()]
+        return sorted(rows, key=lambda row: row["state_bytes"] + row["derived_bytes"], reverse=True)
+
+    def totals(self):
+        rows = self.report()
+        return {"sessions": len(rows), "state_bytes": sum(r["state_bytes"] for r in rows),
+                "derived_bytes": sum(r["derived_bytes"] for r in rows), "evicted": self.evicted}
+
+
+class SharedCache:
+    """Thread-safe LRU shared by all sessions, e.g. for figures keyed by the data they plot."""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get_or_build(self, key, build):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        value = build()
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return value
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+
+# Bucket of an absolute month index (year * 12 + month - 1) at each reporting grain.
+GRAINS = {
+    'Monthly': lambda month: month,
+    'Quarterly': lambda month: month // 3,
+    'Annual': lambda month: month // 12,
+}
+LABELS = {
+    'Monthly': lambda b: f"{b // 12}-{b % 12 + 1:02d}",
+    'Quarterly': lambda b: f"Q{b % 4 + 1} {b // 4}",
+    'Annual': lambda b: str(b),
+}
+
+
+def month_index(dates):
+    dates = pd.DatetimeIndex(dates)
+    return (dates.year * 12 + dates.month - 1).to_numpy(np.int64)
+
+
+class _Rollup:
+    # Dense (series x bucket) sums for one grain. Buckets grow to the right as later months arrive.
+
+    def __init__(self, n_series, first_bucket):
+        self.first = first_bucket
+        self.actual = np.zeros((n_series, 0))
+        self.forecast = np.zeros((n_series, 0))
+        self.last = first_bucket - 1
+
+    def add(self, series, bucket, actual, forecast):
+        width = int(bucket.max()) - self.first + 1
+        if width > self.actual.shape[1]:
+            grow = max(width, 2 * self.actual.shape[1]) - self.actual.shape[1]
+            self.actual = np.pad(self.actual, ((0, 0), (0, grow)))
+            self.forecast = np.pad(self.forecast, ((0, 0), (0, grow)))
+        col = bucket - self.first
+        # Only the buckets touched by this batch change.
+        np.add.at(self.actual, (series, col), actual)
+        np.add.at(self.forecast, (series, col), forecast)
+        self.last = max(self.last, int(bucket.max()))
+
+
+class YieldSeriesStore:
+    """Append-only monthly forecast/actual store with Monthly, Quarterly and Annual rollups.
+
+    Raw rows are kept column-wise at monthly grain; every append updates the rollup buckets it
+    touches, so readers slice precomputed aggregates and the three grains always agree.
+    """
+
+    def __init__(self, series_ids, capacity=1024):
+        self.index = {series_id: i for i, series_id in enumerate(series_ids)}
+        self.columns = {
+            'series': np.empty(capacity, np.int32),
+            'month': np.empty(capacity, np.int32),
+            'actual': np.empty(capacity, np.float64),
+            'forecast': np.empty(capacity, np.float64),
+        }
+        self.size = 0
+        self.rollups = {}
+
+    def __len__(self):
+        return self.size
+
+    def append(self, series, month, actual, forecast):
+        # Rows for one or more (series row, month index) pairs; months may not precede the first append.
+        series, month = np.atleast_1d(series).astype(np.int32), np.atleast_1d(month).astype(np.int32)
+        actual, forecast = np.atleast_1d(actual).astype(np.float64), np.atleast_1d(forecast).astype(np.float64)
+        n = len(series)
+        if self.size + n > len(self.columns['series']):
+            capacity = max(self.size + n, 2 * len(self.columns['series']))
+            for name, column in self.columns.items():
+                grown = np.empty(capacity, column.dtype)
+                grown[:self.size] = column[:self.size]
+                self.columns[name] = grown
+        for name, values in (('series', series), ('month', month), ('actual', actual), ('forecast', forecast)):
+            self.columns[name][self.size:self.size + n] = values
+        self.size += n
+
+        for grain, bucket_of in GRAINS.items():
+            bucket = bucket_of(month.astype(np.int64))
+            if grain not in self.rollups:
+                self.rollups[grain] = _Rollup(len(self.index), int(bucket.min()))
+            elif bucket.min() < self.rollups[grain].first:
+                raise ValueError("the store is append-only: months before the first stored month are not accepted")
+            self.rollups[grain].add(series, bucket, actual, forecast)
+
+    def table(self):
+        # All stored rows as a DataFrame over the column buffers (no copy of the data).
+        return pd.DataFrame({name: column[:self.size] for name, column in self.columns.items()}, copy=False)
+
+    def frame(self, series_id, grain, last):
+        # The most recent `last` buckets of one series at the given grain.
+        rollup = self.rollups[grain]
+        row = self.index[series_id]
+        stop = rollup.last - rollup.first + 1
+        start = max(stop - last, 0)
+        return pd.DataFrame({
+            'Forecasted Yield (kg)': rollup.forecast[row, start:stop],
+            'Actual Yield (kg)': rollup.actual[row, start:stop],
+        }, index=pd.Index([LABELS[grain](b) for b in range(rollup.first + start, rollup.first + stop)],
+                          name='Period'))
@@ -0,0 +1,233 @@
+"""Parallel per-region training: K-Means model selection and rule mining across a process pool.
+
+Usage: python train.py [--history farms.csv] [--k 2-6] [--restarts 3] [--processes 32]
+
+The farm history is encoded once and placed in shared memory, grouped by region so every region
+is a contiguous slice; workers attach to the same pages instead of receiving copies. Three stages
+fan out over the pool:
+
+1. fit    one task per (region, k, restart): a K-Means fit, its inertia and a sampled silhouette
+2. label  one task per region: labels for the chosen model (written into shared memory) and its cluster table
+3. mine   one task per (region, cluster): Apriori rules for that cluster's farms
+
+For each region and k the restart with the lowest inertia is kept, and the region's k is the one
+whose kept fit has the best silhouette. Every region is published as its own artifact under ``<model dir>/regions/<region>/``.
+Workers are started with the spawn method and single-threaded BLAS, so N processes use N cores.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from artifacts import MODEL_DIR, region_model_dir, save_artifact
+from clustering import FEATURES, KMeansModel, build_cluster_table, encode_profiles, squared_distances
+from history import history_source, load_history
+from rules import mine_rules
+
+THREAD_LIMITS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+_shared = {}  # worker-side views of the shared arrays
+_meta = {}
+
+
+# --- SHARED MEMORY ---
+class SharedArrays:
+    """Named NumPy arrays copied once into shared-memory blocks; ``specs`` lets workers attach."""
+
+    def __init__(self, arrays):
+        self.blocks = {}
+        self.specs = {}
+        for name, value in arrays.items():
+            value = np.ascontiguousarray(value)
+            block = shared_memory.SharedMemory(create=True, size=max(value.nbytes, 1))
+            np.ndarray(value.shape, value.dtype, buffer=block.buf)[...] = value
+            self.blocks[name] = block
+            self.specs[name] = (block.name, value.shape, value.dtype.str)
+
+    def view(self, name):
+        _, shape, dtype = self.specs[name]
+        return np.ndarray(shape, dtype, buffer=self.blocks[name].buf)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        return False
+
+
+def _attach(specs, meta):
+    # Pool initializer. Workers share the parent's resource tracker, and the parent unlinks the blocks.
+    for name, (block_name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        _shared[name] = (block, np.ndarray(shape, np.dtype(dtype), buffer=block.buf))
+    _meta.update(meta)
+
+
+def _array(name, region=None):
+    values = _shared[name][1]
+    if region is None:
+        return values
+    start, stop = _meta["bounds"][region]
+    return values[start:stop]
+
+
+def _region_history(region):
+    X = _array("X", region)
+    frame = pd.DataFrame(X, columns=FEATURES)
+    frame["crop"] = np.asarray(_meta["crops"], dtype=object)[_array("crop", region)]
+    frame["yield"] = _array("yield", region)
+    return frame
+
+
+# --- TASKS ---
+def silhouette(X, labels):
+    # Mean silhouette coefficient of a (small) sample, from its full pairwise distance matrix.
+    sq = np.einsum('ij,ij->i', X, X)
+    D = np.sqrt(np.maximum(sq[:, None] + sq[None, :] - 2.0 * X @ X.T, 0.0))
+    k = labels.max() + 1
+    onehot = np.eye(k)[labels]
+    sizes = onehot.sum(axis=0)
+    sums = D @ onehot
+    own = sizes[labels]
+    a = sums[np.arange(len(X)), labels] / np.maximum(own - 1, 1)
+    other = np.where(onehot.astype(bool), np.inf, sums / np.maximum(sizes, 1))
+    other[:, sizes == 0] = np.inf
+    b = other.min(axis=1)
+    s = np.where(own > 1, (b - a) / np.maximum(np.maximum(a, b), 1e-12), 0.0)
+    return float(s.mean())
+
+
+def _fit_task(task):
+    region, k, seed = task
+    X = _array("X", region)
+    model = KMeansModel(n_clusters=k, n_init=1, seed=seed).fit(X)
+    Xs = model._scale(X)
+    inertia = float(np.min(model.transform(X), axis=1).sum())
+    rng = np.random.default_rng(seed)
+    sample = Xs[rng.choice(len(Xs), min(len(Xs), _meta["sample"]), replace=False)]
+    score = silhouette(sample, np.argmin(squared_distances(sample, model.centers_), axis=1))
+    return {"region": region, "k": k, "seed": seed, "inertia": inertia, "silhouette": score,
+            "state": (model.mean_, model.scale_, model.centers_, model.counts_)}
+
+
+def _label_task(task):
+    region, state = task
+    model = KMeansModel.restore(*state)
+    _array("labels", region)[:] = model.predict(_array("X", region))
+    return region, build_cluster_table(model, _region_history(region))
+
+
+def _mine_task(task):
+    region, cluster = task
+    rows = np.flatnonzero(_array("labels", region) == cluster)
+    baskets = np.asarray(_meta["baskets"], dtype=object)
+    transactions = pd.DataFrame({
+        "cluster": cluster,
+        "crop": np.asarray(_meta["crops"], dtype=object)[_array("crop", region)[rows]],
+        "yield": _array("yield", region)[rows],
+        "practices": baskets[_array("practices", region)[rows]],
+    })
+    return region, mine_rules(transactions) if len(rows) else None
+
+
+# --- ORCHESTRATION ---
+def select_models(fits):
+    # Per region and k keep the restart with the lowest inertia; then pick the k whose fit has the best silhouette.
+    per_k = {}
+    for fit in fits:
+        key = (fit["region"], fit["k"])
+        if key not in per_k or fit["inertia"] < per_k[key]["inertia"]:
+            per_k[key] = fit
+    best = {}
+    for (region, _), fit in sorted(per_k.items()):
+        if region not in best or fit["silhouette"] > best[region]["silhouette"]:
+            best[region] = fit
+    return best
+
+
+def train_regions(history, ks=range(2, 7), restarts=3, processes=None, model_dir=MODEL_DIR, sample=2000,
+                  publish=True, source=None):
+    """Train, select and publish one model per region; returns {region: summary dict}.
+
+    ``source`` is the history file (None for the synthetic history); each artifact records it with
+    its region, so the forecaster and neighbour index of a region model see only that region's farms.
+    """
+    by_region = "region" in history
+    region = history["region"] if by_region else pd.Series("All", index=history.index)
+    region_codes, regions = pd.factorize(region.astype(str), sort=True)
+    order = np.argsort(region_codes, kind="stable")
+    bounds = np.searchsorted(region_codes[order], np.arange(len(regions) + 1))
+    crop_codes, crops = pd.factorize(history["crop"].astype(str), sort=True)
+    basket_codes, baskets = pd.factorize(history["practices"].fillna(""))
+    arrays = {
+        "X": encode_profiles(history)[order],
+        "crop": crop_codes.astype(np.int16)[order],
+        "yield": history["yield"].to_numpy(np.float64)[order],
+        "practices": basket_codes.astype(np.int32)[order],
+        "labels": np.zeros(len(history), np.int16),
+    }
+    meta = {"bounds": {r: (int(bounds[r]), int(bounds[r + 1])) for r in range(len(regions))},
+            "crops": list(crops), "baskets": list(baskets), "sample": sample}
+
+    context = multiprocessing.get_context("spawn")
+    saved = {name: os.environ.get(name) for name in THREAD_LIMITS}
+    os.environ.update({name: "1" for name in THREAD_LIMITS})  # read by the spawned workers' BLAS
+    try:
+        with SharedArrays(arrays) as shared, context.Pool(processes, _attach, (shared.specs, meta)) as pool:
+            fits = pool.map(_fit_task, [(r, k, seed) for r in range(len(regions)) for k in ks
+                                        for seed in range(restarts)], chunksize=1)
+            best = select_models(fits)
+            tables = dict(pool.map(_label_task, [(r, fit["state"]) for r, fit in best.items()], chunksize=1))
+            mined = pool.map(_mine_task, [(r, c) for r, fit in best.items() for c in range(fit["k"])], chunksize=1)
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+    summary = {}
+    for r, fit in best.items():
+        rules = pd.concat([table for region, table in mined if region == r and table is not None], ignore_index=True)
+        model = KMeansModel.restore(*fit["state"])
+        path = save_artifact(model, tables[r], rules, model_dir=region_model_dir(regions[r], model_dir),
+                             publish=publish, history={"path": source, "region": regions[r] if by_region else None})
+        summary[regions[r]] = {"farms": int(bounds[r + 1] - bounds[r]), "k": fit["k"],
+                               "silhouette": round(fit["silhouette"], 3), "rules": len(rules), "path": path}
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train and publish one model per region in parallel.")
+    parser.add_argument('--history', help="CSV of historical farm records with a region column")
+    parser.add_argument('--k', default="2-6", help="range of cluster counts to try, e.g. 2-6")
+    parser.add_argument('--restarts', type=int, default=3)
+    parser.add_argument('--processes', type=int, help="worker processes (default: all cores)")
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    args = parser.parse_args(argv)
+
+    try:
+        source = history_source(args.history)
+    except FileNotFoundError as error:
+        parser.error(str(error))
+    low, _, high = args.k.partition("-")
+    start = time.perf_counter()
+    summary = train_regions(load_history(source), range(int(low), int(high or low) + 1), args.restarts,
+                            args.processes, args.model_dir, source=source)
+    for region, info in summary.items():
+        print(f"{region}: {info['farms']} farms, k={info['k']} (silhouette {info['silhouette']}), "
+              f"{info['rules']} rules -> {info['path']}")
+    print(f"Trained {len(summary)} regions in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
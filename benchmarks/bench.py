@@ -0,0 +1,294 @@
+"""Benchmark suite: clustering, rule mining and lookup, forecasting and headless view reruns.
+
+Usage:
+    python benchmarks/bench.py run [--sizes 1k,1M,10M] [--only cluster,rules,forecast,app] [--out results.json]
+                                   [--baseline old.json]
+    python benchmarks/bench.py compare old.json new.json [--thresholds benchmarks/thresholds.json]
+
+Synthetic farm histories of each size are generated in chunks of at most a million farms (one seed
+per chunk), so 10M never has to exist as a single frame. Every result is keyed ``name@size``.
+Its ``value`` is in seconds and lower is better: the best of ``--repeat`` runs for batch
+operations, and the median call for latency benchmarks. Throughput and p95 are recorded alongside.
+``compare`` flags any benchmark whose value grew by more than its threshold ratio and exits with
+status 1, so two commits' result files can gate a change.
+"""
+import argparse
+import fnmatch
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT, "Application")
+sys.path.insert(0, APP_DIR)
+
+from clustering import KMeansModel, encode_profiles  # noqa: E402
+from forecast import cluster_forecaster, holt_winters, PERIODS  # noqa: E402
+from history import CROPS, synthetic_history, synthetic_yield_series  # noqa: E402
+from rule_store import RuleStore, write_rule_store  # noqa: E402
+from rules import RuleCounter, build_transactions, mine_rules  # noqa: E402
+
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1M": 1_000_000, "10M": 10_000_000}
+GROUPS = ("cluster", "rules", "forecast", "app")
+CHUNK = 1_000_000
+SERIES_CHUNK = 100_000
+THRESHOLDS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "thresholds.json")
+VIEWS = ("input", "zone", "planner", "tracking")
+
+
+# --- DATA ---
+def farm_chunks(n, seed=0, chunk=CHUNK):
+    # Synthetic farm history as frames of at most `chunk` rows; farm IDs continue across chunks.
+    chunks = []
+    for i, start in enumerate(range(0, n, chunk)):
+        frame = synthetic_history(min(chunk, n - start), seed=seed + i)
+        frame["farm_id"] += start
+        chunks.append(frame)
+    return chunks
+
+
+# --- MEASUREMENT ---
+class Suite:
+    """Collects result records keyed ``name@size``."""
+
+    def __init__(self, repeat=3, calls=200):
+        self.repeat = repeat
+        self.calls = calls
+        self.results = {}
+
+    def _record(self, name, size, **fields):
+        key = f"{name}@{size}"
+        self.results[key] = {"name": name, "size": size, **fields}
+        shown = fields["value"] * 1e3
+        extra = f", {fields['throughput_per_s']:,.0f}/s" if "throughput_per_s" in fields else ""
+        print(f"{key:<32} {shown:>12.3f} ms{extra}", file=sys.stderr)
+
+    def batch(self, name, size, fn, items=None, repeat=None):
+        # Best-of-`repeat` wall time of fn(); returns fn's last result.
+        best, result = float("inf"), None
+        for _ in range(repeat or self.repeat):
+            start = time.perf_counter()
+            result = fn()
+            best = min(best, time.perf_counter() - start)
+        fields = {"metric": "seconds", "value": best, "repeat": repeat or self.repeat}
+        if items:
+            fields.update(items=items, throughput_per_s=items / best)
+        self._record(name, size, **fields)
+        return result
+
+    def total(self, name, size, seconds, items):
+        # A wall time accumulated by the caller (e.g. over chunks whose generation is not timed).
+        self._record(name, size, metric="seconds", value=seconds, repeat=1, items=items,
+                     throughput_per_s=items / seconds)
+
+    def latency(self, name, size, fn, calls=None):
+        # fn(i) called `calls` times; value is the median call.
+        calls = calls or self.calls
+        times = np.empty(calls)
+        for i in range(calls):
+            start = time.perf_counter()
+            fn(i)
+            times[i] = time.perf_counter() - start
+        self._record(name, size, metric="p50_seconds", value=float(np.median(times)),
+                     p95_seconds=float(np.percentile(times, 95)), calls=calls)
+
+
+# --- BENCHMARKS ---
+def bench_cluster(suite, size, chunks):
+    X = np.concatenate([encode_profiles(chunk) for chunk in chunks])
+    repeat = 1 if len(X) > CHUNK else None
+    model = suite.batch("cluster.fit", size, lambda: KMeansModel(n_clusters=3, seed=0).fit(X), len(X), repeat)
+    labels = suite.batch("cluster.predict.batch", size, lambda: model.predict(X), len(X), repeat)
+    rows = np.random.default_rng(0).integers(0, len(X), suite.calls)
+    suite.latency("cluster.predict.single", size, lambda i: model.predict(X[rows[i]:rows[i] + 1]))
+    return model, labels
+
+
+def bench_rules(suite, size, chunks, labels):
+    # rules.mine_rules is the bitset Apriori that training publishes; rules.mine is the streaming
+    # RuleCounter used by incremental updates. Building the transactions table is not timed.
+    repeat = 1 if len(labels) > CHUNK else None
+    transactions, start = [], 0
+    for chunk in chunks:
+        transactions.append(build_transactions(chunk, labels[start:start + len(chunk)]))
+        start += len(chunk)
+    transactions = pd.concat(transactions, ignore_index=True)
+    suite.batch("rules.mine_rules", size, lambda: mine_rules(transactions), len(labels), repeat)
+    del transactions
+
+    def mine():
+        counter, start = RuleCounter(), 0
+        for chunk in chunks:
+            counter.add(build_transactions(chunk, labels[start:start + len(chunk)]))
+            start += len(chunk)
+        return counter.rules()
+    rules = suite.batch("rules.mine", size, mine, len(labels), repeat)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "rules.agb")
+        write_rule_store(rules, path)
+        store = RuleStore.open(path)
+        rng = np.random.default_rng(0)
+        keys = list(zip(rng.integers(0, int(labels.max()) + 1, suite.calls), rng.choice(CROPS, suite.calls)))
+        suite.latency("rules.top_k", size, lambda i: store.top_k(int(keys[i][0]), keys[i][1], k=20))
+
+
+def bench_forecast(suite, size, chunks, model):
+    # Holt-Winters over one series per farm, SERIES_CHUNK farms at a time; series generation is not timed.
+    seconds = 0.0
+    for chunk in chunks:
+        for start in range(0, len(chunk), SERIES_CHUNK):
+            _, _, Y = synthetic_yield_series(chunk.iloc[start:start + SERIES_CHUNK])
+            began = time.perf_counter()
+            holt_winters(Y)
+            seconds += time.perf_counter() - began
+    suite.total("forecast.fit", size, seconds, sum(len(chunk) for chunk in chunks))
+
+    forecaster = cluster_forecaster(model, chunks[0].iloc[:SERIES_CHUNK])
+    suite.latency("forecast.tracking", size,
+                  lambda i: forecaster.tracking_frame(i % model.n_clusters, PERIODS[i % len(PERIODS)]))
+
+
+def bench_app(suite, calls=20):
+    # Cold start, then warm reruns of each view; the app serves the current model artifact.
+    from streamlit.testing.v1 import AppTest
+    logging.getLogger("streamlit").setLevel(logging.ERROR)  # deprecation warnings on every rerun
+
+    def start():
+        app = AppTest.from_file(os.path.join(APP_DIR, "app.py"), default_timeout=120)
+        return app.run()
+    app = suite.batch("app.cold_start", "app", start, repeat=1)
+    for step, view in enumerate(VIEWS, start=1):
+        if app.exception:
+            raise RuntimeError(f"{view} view failed: {app.exception}")
+        suite.latency(f"app.rerun.{view}", "app", lambda i: app.run(), calls)
+        if step < len(VIEWS):
+            app.button[0].click().run()
+
+
+# --- RUN / COMPARE ---
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, only=GROUPS, repeat=3, calls=200):
+    suite = Suite(repeat, calls)
+    for label in sizes:
+        if not {"cluster", "rules", "forecast"} & set(only):
+            break
+        chunks = farm_chunks(SIZES[label])
+        if "cluster" in only:
+            model, labels = bench_cluster(suite, label, chunks)
+        else:
+            X = np.concatenate([encode_profiles(chunk) for chunk in chunks])
+            model = KMeansModel(n_clusters=3, seed=0).fit(X)
+            labels = model.predict(X)
+        if "rules" in only:
+            bench_rules(suite, label, chunks, labels)
+        if "forecast" in only:
+            bench_forecast(suite, label, chunks, model)
+        del chunks
+    if "app" in only:
+        bench_app(suite)
+    return {
+        "meta": {"commit": _git_commit(), "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                 "python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+                 "cpus": os.cpu_count(), "sizes": list(sizes), "repeat": repeat, "calls": calls},
+        "results": suite.results,
+    }
+
+
+def load_thresholds(path=THRESHOLDS):
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def threshold_for(name, thresholds):
+    # The first matching glob in "benchmarks" wins, else "default".
+    for pattern, ratio in thresholds.get("benchmarks", {}).items():
+        if fnmatch.fnmatchcase(name, pattern):
+            return ratio
+    return thresholds["default"]
+
+
+def compare(baseline, current, thresholds):
+    """Rows for benchmarks present in both runs; ``regressed`` when the ratio exceeds the threshold.
+
+    Differences smaller than ``min_seconds`` never count, so sub-millisecond noise does not fail a run.
+    """
+    rows = []
+    for key, new in current["results"].items():
+        old = baseline["results"].get(key)
+        if old is None or old["metric"] != new["metric"]:
+            continue
+        limit = threshold_for(new["name"], thresholds)
+        ratio = new["value"] / old["value"] if old["value"] > 0 else float("inf")
+        regressed = ratio > limit and new["value"] - old["value"] > thresholds.get("min_seconds", 0.0)
+        rows.append({"benchmark": key, "baseline": old["value"], "current": new["value"], "ratio": ratio,
+                     "threshold": limit, "regressed": regressed})
+    return rows
+
+
+def report(rows, out=sys.stdout):
+    for row in rows:
+        flag = "REGRESSED" if row["regressed"] else "ok"
+        print(f"{row['benchmark']:<32} {row['baseline'] * 1e3:>11.3f} ms {row['current'] * 1e3:>11.3f} ms "
+              f"x{row['ratio']:.2f} (max x{row['threshold']:.2f})  {flag}", file=out)
+    regressions = sum(row["regressed"] for row in rows)
+    print(f"{len(rows)} benchmarks compared, {regressions} regressed", file=out)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run or compare Agri-forecast benchmarks.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run")
+    run_parser.add_argument("--sizes", default="1k,1M", help=f"comma-separated, from {', '.join(SIZES)}")
+    run_parser.add_argument("--only", default=",".join(GROUPS), help="comma-separated benchmark groups")
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument("--calls", type=int, default=200, help="calls per latency benchmark")
+    run_parser.add_argument("--out", help="write results JSON here (default: stdout)")
+    run_parser.add_argument("--baseline", help="results JSON to compare against")
+    run_parser.add_argument("--thresholds", default=THRESHOLDS)
+    compare_parser = sub.add_parser("compare")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--thresholds", default=THRESHOLDS)
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        with open(args.baseline) as old, open(args.current) as new:
+            rows = compare(json.load(old), json.load(new), load_thresholds(args.thresholds))
+        return 1 if report(rows) else 0
+
+    sizes = [label for label in args.sizes.split(",") if label]
+    unknown = [label for label in sizes if label not in SIZES]
+    if unknown:
+        parser.error(f"unknown size(s): {', '.join(unknown)}")
+    results = run(sizes, [g for g in args.only.split(",") if g], args.repeat, args.calls)
+    if args.out:
+        with open(args.out, "w") as fh:
+            json.dump(results, fh, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+    if args.baseline:
+        with open(args.baseline) as fh:
+            rows = compare(json.load(fh), results, load_thresholds(args.thresholds))
+        return 1 if report(rows, sys.stderr) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())